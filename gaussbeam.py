@@ -6,11 +6,14 @@ def find_beam_width(diameter, wavelength, dist):
     return beam_width
 
 def find_frac(radius, beam_width, dist):
-    """Calculates fraction of laser power incidenet on circular lightsail."""
+    """Calculates fraction of laser power incidenet on circular lightsail.
+    Radius and beam width may be arrays (e.g. for a fleet of sails)."""
     #To prevent overflow warnings, set a point where the fraction loss is appreciable; until then fraction = 1
     #Choose to care about fraction when it becomes <= 0.999, which occurs when:
     pt = 2*radius**2/np.log(10000)
-    if beam_width**2 <= pt:
+    if np.ndim(radius) or np.ndim(beam_width):
+        fraction = np.where(beam_width**2 <= pt, 1, 1-np.exp(-2*radius**2/np.maximum(beam_width**2, pt)))
+    elif beam_width**2 <= pt:
         fraction = 1
     else:
         fraction = 1-np.exp(-2*radius**2/beam_width**2)
@@ -0,0 +1,51 @@
+import numpy as np
+
+""" Evaluation of material equations (see README, Material Equations).
+
+    Equations take a NumPy array of wavelengths (m) and return an array of the
+    same shape, so that n or k over a whole band is found in one call. Branches
+    between models should use masks (or np.where), not if statements.
+
+    Equations written for one float at a time (e.g. with
+    'if wavelength < 7e-6') still work: the first time an equation is used on
+    several wavelengths, it is called on a few of them both ways, and if the
+    results do not match (or the array call fails), it is called element-wise
+    from then on. An equation can skip this check by setting a 'vectorised'
+    attribute to True or False.
+"""
+
+#Whether each equation (by code object) follows the array contract
+_vectorised = {}
+
+def evaluate_equation(equation, wavelengths):
+    """ Evaluates equation at a 1D array of wavelengths. Returns an array of
+        floats of the same shape.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    if wavelengths.size < 2:
+        # A single wavelength works with either contract
+        return np.array([equation(wl) for wl in wavelengths], dtype=float)
+    vectorised = getattr(equation, 'vectorised', None)
+    if vectorised is None:
+        vectorised = _vectorised.get(equation.__code__)
+    if vectorised is None:
+        vectorised = _check_vectorised(equation, wavelengths)
+        _vectorised[equation.__code__] = vectorised
+    if vectorised:
+        values = np.asarray(equation(wavelengths), dtype=float)
+        return np.broadcast_to(values, wavelengths.shape).copy()
+    return np.array([equation(wl) for wl in wavelengths], dtype=float)
+
+def _check_vectorised(equation, wavelengths):
+    """ Checks if equation gives the same values for an array of wavelengths
+        as one wavelength at a time, on the first, middle and last wavelengths.
+    """
+    probe = wavelengths[[0, wavelengths.size//2, -1]]
+    try:
+        values = np.asarray(equation(probe), dtype=float)
+    except Exception:
+        return False
+    if values.shape != probe.shape:
+        return False
+    scalar_values = np.array([equation(wl) for wl in probe], dtype=float)
+    return bool(np.allclose(values, scalar_values, rtol=1e-10, atol=0, equal_nan=True))
@@ -1,5 +1,7 @@
-from .save_load_mat import save_material, del_material, material_exists, load_material, make_list_from_file
+from .save_load_mat import save_material, del_material, material_exists, load_material, make_list_from_file, load_equation
 from .interpolator import interpolate_from_list
+from .tabulate import tabulate_equation, equation_source
+from .equations import evaluate_equation
 import scipy
 import numpy as np
 from os import path
@@ -24,7 +26,8 @@ from os import path
             * each entry is another list of form:
                 [ str: {name}
                   list/tuple: {range},
-                  func: {equation}
+                  func: {equation},
+                  dict: {tabulation} (None if the equation is not tabulated)
                 ]
             * the RANGE in which an equation can be used accurately is described
               by start_wavelength and end_wavelength. Range goes FROM
@@ -33,12 +36,45 @@ from os import path
               BOTH wavelengths should be given in metres.
 
 IMPORTANT NOTE: If using an equation, ensure the equation TAKES IN wavelengths
-                IN METRES as units. This is especially important when using
+                IN METRES as units, as a NumPy array, and returns an array of
+                the same shape (see equations.py). This is especially important when using
                 equations from papers which may use wavenumbers in their equations
                 in which case the user is expected to convert the units to
                 micrometres within the scope of their defined/loaded function
 """
 
+def _find_constant(wavelength, equations, ls):
+    """ Finds an optical constant (n or k) at a wavelength (float or array of
+        floats). Values are interpolated from the list, unless the wavelength
+        lies within the range of an equation, in which case the equation is
+        used. If equation ranges overlap, the last equation added is used.
+        Each equation (or table) is called once, on every wavelength in its
+        range, selected by a mask.
+    """
+    wavelengths = np.atleast_1d(np.asarray(wavelength, dtype=float))
+    values = np.asarray(interpolate_from_list(ls, wavelengths), dtype=float)
+    for entry in equations:
+        _, range, equation_func = entry[:3]     # unpack entry
+        tabulation = entry[3] if len(entry) > 3 else None
+        start_wavelength, end_wavelength = range       # unpack range
+        # Check which wavelengths are in valid range for equation use
+        in_range = (wavelengths >= start_wavelength) & (wavelengths <= end_wavelength)
+        if in_range.any():
+            if tabulation is not None:
+                values[in_range] = interpolate_from_list(tabulation['table'], wavelengths[in_range])
+            else:
+                values[in_range] = evaluate_equation(equation_func, wavelengths[in_range])
+    if np.ndim(wavelength) == 0:
+        return values[0]
+    return values
+
+def _tabulate(equation, range, rtol, atol):
+    """ Tabulation of an equation entry: dict of table, its error bound and
+        the source it was made from.
+    """
+    table, info = tabulate_equation(equation, range, rtol, atol)
+    return {'table': table, **info, 'source': equation_source(equation, range)}
+
 class Material:
 
     def __init__(self, name=None, density=None, max_temp=None, abs_coeff=None, n_list_path=None, k_list_path=None):
@@ -50,10 +86,12 @@ class Material:
             self.density = mat.get_density()
             self.max_temp = mat.get_max_temp()
             self.abs_coeff = mat.get_abs_coeff()
-            self.n_list = mat.get_n_list()
-            self.k_list = mat.get_k_list()
-            self.n_equations = mat.get_n_equations()
-            self.k_equations = mat.get_k_equations()
+            # Copies, so that editing this object does not change the
+            # registry's object (which loaded sails use) before it is saved
+            self.n_list = None if mat.get_n_list() is None else mat.get_n_list().copy()
+            self.k_list = None if mat.get_k_list() is None else mat.get_k_list().copy()
+            self.n_equations = [list(entry) for entry in mat.get_n_equations()]
+            self.k_equations = [list(entry) for entry in mat.get_k_equations()]
         else:
             if name is None:
                 raise ValueError('Enter name')
@@ -129,19 +167,9 @@ class Material:
             equation in materials_equations is identified by the material name
             (and if there is an equation for n and k, the 'n' and 'k' string
             identifiers in the second argument helps to differentiate).
-            Requires wavelength as float to find values
+            Requires wavelength as float or array of floats to find values
         """
-        found_equation = False
-        for entry in self.n_equations:
-            _, range, equation_func = entry     # unpack entry
-            start_wavelength, end_wavelength = range       # unpack range
-            # Check if in valid range for equation use
-            if wavelength >= start_wavelength and wavelength <= end_wavelength:
-                n = equation_func(wavelength)
-                found_equation = True
-        if not found_equation:
-            n = interpolate_from_list(self.n_list, wavelength)
-        return n
+        return _find_constant(wavelength, self.n_equations, self.n_list)
 
     def get_n_list(self):
         return self.n_list
@@ -153,17 +181,13 @@ class Material:
         save_material(self)
 
     def get_k(self, wavelength):
-        found_equation = False
-        for entry in self.k_equations:
-            _, range, equation_func = entry     # unpack entry
-            start_wavelength, end_wavelength = range       # unpack range
-            # Check if in valid range for equation use
-            if wavelength >= start_wavelength and wavelength <= end_wavelength:
-                k = equation_func(wavelength)
-                found_equation = True
-        if not found_equation:
-            k = interpolate_from_list(self.k_list, wavelength)
-        return k
+        return _find_constant(wavelength, self.k_equations, self.k_list)
+
+    def get_nk(self, wavelength):
+        """ Complex refractive index n + ik at a wavelength (float or array of
+            floats).
+        """
+        return self.get_n(wavelength) + 1j*self.get_k(wavelength)
 
     def get_k_list(self):
         return self.k_list
@@ -174,7 +198,7 @@ class Material:
     def get_k_equations(self):
         return self.k_equations
 
-    def add_equation(self, name, range, filepath, n_or_k):
+    def add_equation(self, name, range, filepath, n_or_k, tabulate=False, rtol=1e-4, atol=1e-7):
         """ Extracts an equation from a .py file that is valid within a specified
             wavelength range (in m) = [start_wavelength, end_wavelength] and saves it
             as a material attribute. A name should also be attached to the
@@ -182,6 +206,18 @@ class Material:
             the entry to an equations_list list (n_equations or k_equations
             depending on input).
 
+            The .py file should define a single function; it is copied into
+            saved_materials, and the material refers to the copy. Instead of
+            a file, filepath may also be 'module:function' for a function in
+            an importable module.
+
+            If tabulate is True, the equation is tabulated onto a dense
+            wavelength grid, refined until linear interpolation is within
+            atol + rtol*|value| of the equation at check points in every
+            interval (see tabulate.py), and values are interpolated from the
+            table. The table is saved with the material, and is regenerated
+            when the material is loaded if the equation or its range changed.
+
             Raises an error if invalid name (e.g. repeated names)
             Raises an error if there is an equation with a wavelength range
             which overlaps with the equation being added
@@ -190,14 +226,10 @@ class Material:
             equations_list = self.n_equations
         elif n_or_k == 'k':
             equations_list = self.k_equations
-        # Make a dictionary to store the function in
-        dic = {}
-        exec(open(filepath).read(), globals(), dic)
-        func, = dic.values()    # assign var to function for storage in list entry
-        entry = [name, range, func]
+        func = load_equation(filepath)
+        entry = [name, range, func, _tabulate(func, range, rtol, atol) if tabulate else None]
         if name not in [eq[0] for eq in equations_list]:
             equations_list.append(entry)
-        dic.clear()     # Cleared just in case some memory issues occur
         save_material(self)
         return
 
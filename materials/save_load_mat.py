@@ -1,6 +1,42 @@
 from pathlib import Path
-import dill as pickle
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import shutil
+import numpy as np
 from numpy import loadtxt, pi
+from .tabulate import equation_source
+
+""" Materials are stored in a single indexed store in the saved_materials
+    directory:
+        - index.json: name -> {density, max_temp, abs_coeff, n_list, k_list,
+          n_equations, k_equations, version}
+        - <name>_n.npy, <name>_k.npy: n and k tables, loaded memory-mapped
+        - <name>_<n or k>_<equation name>.npy: tabulated equations (see
+          tabulate.py), loaded memory-mapped
+        - equations/: copies of the .py files equations were added from
+    Equations are stored as references 'module:function', where module is
+    either an importable module (e.g. 'mypackage.silica') or a .py file in the
+    equations directory. Loading a material never unpickles code.
+
+    The index is read once and re-read only if index.json changes, so lookups
+    are dictionary lookups. Use migrate_pickles() to convert materials saved
+    as pkl files by older versions.
+"""
+
+INDEX = 'index.json'
+EQUATIONS = 'equations'
+
+#In-memory copy of the index. ((mtime, size) of index.json when read, path of index.json, index)
+_index = None
+#In-memory registry of loaded materials, so each material is only read once.
+#Maps name -> (version of material when loaded, Material)
+_registry = {}
+#Modules that equations have been imported from. Maps path of .py file -> module
+_equation_modules = {}
 
 def mkmatdir():
     """Make saved_materials directory if it does not exist. Return Path object for directory."""
@@ -8,33 +44,297 @@ def mkmatdir():
     matdir.mkdir(exist_ok=True)
     return matdir
 
+def _matdir():
+    """Path of saved_materials directory, without touching the filesystem."""
+    return Path('saved_materials')
+
+def _read_index():
+    """Return the index (dict of entries), reading index.json only if it has
+    changed since it was last read."""
+    global _index
+    path = _matdir().joinpath(INDEX)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        _index = None
+        return {}
+    version = (stat.st_mtime_ns, stat.st_size)
+    if _index is None or _index[0] != version or _index[1] != path.resolve():
+        with path.open() as f:
+            _index = (version, path.resolve(), json.load(f))
+    return _index[2]
+
+def _write_index(index):
+    """Write index.json atomically, so other processes never read part of it."""
+    global _index
+    path = mkmatdir().joinpath(INDEX)
+    tmp = path.with_name(f'{INDEX}.{os.getpid()}.tmp')
+    with tmp.open('w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, path)
+    stat = path.stat()
+    _index = ((stat.st_mtime_ns, stat.st_size), path.resolve(), index)
+
+def _import_module_from_file(path):
+    """Import a .py file as a module (once per file)."""
+    path = Path(path).resolve()
+    if path not in _equation_modules:
+        spec = importlib.util.spec_from_file_location(f'_starshot_equations.{path.stem}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _equation_modules[path] = module
+    return _equation_modules[path]
+
+def resolve_equation(ref):
+    """Return the function referred to by 'module:function'. module is an
+    importable module, or a .py file (relative to saved_materials)."""
+    module_name, _, function_name = ref.rpartition(':')
+    if module_name.endswith('.py'):
+        module = _import_module_from_file(_matdir().joinpath(module_name))
+    else:
+        module = importlib.import_module(module_name)
+    func = module
+    for attr in function_name.split('.'):
+        func = getattr(func, attr)
+    return func
+
+def load_equation(source):
+    """Load an equation function. source is either 'module:function' for a
+    function in an importable module, or the path of a .py file defining a
+    single function. The .py file is copied into saved_materials/equations,
+    so the original can be deleted afterwards."""
+    if not str(source).endswith('.py'):
+        return resolve_equation(source)
+    source = Path(source)
+    text = source.read_bytes()
+    digest = hashlib.blake2b(text, digest_size=4).hexdigest()
+    equations_dir = mkmatdir().joinpath(EQUATIONS)
+    equations_dir.mkdir(exist_ok=True)
+    copy = equations_dir.joinpath(f'{source.stem}_{digest}.py')
+    if not copy.exists():
+        shutil.copyfile(source, copy)
+    module = _import_module_from_file(copy)
+    funcs = [value for value in vars(module).values()
+             if inspect.isfunction(value) and value.__module__ == module.__name__]
+    if len(funcs) != 1:
+        raise ValueError(f'{source} should define exactly one function')
+    return funcs[0]
+
+def _equation_ref(func):
+    """Reference 'module:function' of an equation function."""
+    filename = Path(func.__code__.co_filename)
+    try:
+        relative = filename.resolve().relative_to(_matdir().resolve())
+        return f'{relative.as_posix()}:{func.__qualname__}'
+    except (ValueError, OSError):
+        pass
+    ref = f'{func.__module__}:{func.__qualname__}'
+    try:
+        if resolve_equation(ref).__code__ is func.__code__:
+            return ref
+    except (ImportError, AttributeError, ValueError):
+        pass
+    raise ValueError(f"Equation '{func.__qualname__}' is not importable. Add equations from "
+                     "a .py file or as 'module:function'.")
+
+def _save_table(stem, table):
+    """Save table as .npy. Returns (file name, hash of contents), or (None, None)."""
+    if table is None:
+        return None, None
+    filename = f'{stem}.npy'
+    path = mkmatdir().joinpath(filename)
+    tmp = path.with_name(f'{filename}.{os.getpid()}.tmp.npy')
+    np.save(tmp, np.asarray(table, dtype=float))
+    os.replace(tmp, path)
+    return filename, hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+
 def save_material(material):
     """Save material."""
-    matdir = mkmatdir()
-    with matdir.joinpath(material.get_name() + '.pkl').open(mode='wb') as f:
-        pickle.dump(material, f, pickle.HIGHEST_PROTOCOL)
+    name = material.get_name()
+    entry = {'density': material.get_density(), 'max_temp': material.get_max_temp(),
+             'abs_coeff': material.get_abs_coeff()}
+    hashes = []
+    for n_or_k, table in (('n', material.get_n_list()), ('k', material.get_k_list())):
+        entry[n_or_k + '_list'], table_hash = _save_table(f'{name}_{n_or_k}', table)
+        hashes.append(table_hash)
+    for n_or_k, equations in (('n', material.get_n_equations()), ('k', material.get_k_equations())):
+        entry[n_or_k + '_equations'] = []
+        for equation in equations:
+            eq_name, range, func = equation[:3]
+            tabulation = equation[3] if len(equation) > 3 else None
+            item = [eq_name, list(range), _equation_ref(func)]
+            if tabulation is not None:
+                filename, table_hash = _save_table(f'{name}_{n_or_k}_{eq_name}', tabulation['table'])
+                hashes.append(table_hash)
+                item.append({'file': filename, **{key: value for key, value in tabulation.items() if key != 'table'}})
+            entry[n_or_k + '_equations'].append(item)
+    text = json.dumps([entry, hashes], sort_keys=True)
+    entry['version'] = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    index = dict(_read_index())
+    index[name] = entry
+    _write_index(index)
+    _registry.pop(name, None) #Reload saved version on next load
 
 def del_material(name):
     """Delete material according to its name."""
-    matdir = mkmatdir()
-    matdir.joinpath(name + '.pkl').unlink()
+    index = dict(_read_index())
+    entry = index.pop(name, None)
+    if entry is not None:
+        _write_index(index)
+        filenames = [entry['n_list'], entry['k_list']]
+        for item in entry['n_equations'] + entry['k_equations']:
+            if len(item) > 3:
+                filenames.append(item[3]['file'])
+        for filename in filenames:
+            if filename is not None:
+                _matdir().joinpath(filename).unlink(missing_ok=True)
+    _registry.pop(name, None)
 
 def material_exists(name):
     """Check if material already exists."""
-    matdir = mkmatdir()
-    for mat in matdir.glob('*.pkl'):
-        if mat.stem == name:
-            return True
-    return False
+    return name in _read_index()
 
 def load_material(name):
-    """Load material from pkl file."""
-    matdir = mkmatdir()
-    try:
-        with matdir.joinpath(name + '.pkl').open(mode='rb') as f:
-            return pickle.load(f)
-    except FileNotFoundError:
+    """Load material from the store. The material is kept in an in-memory
+    registry, and is only read again if it has been saved since it was loaded.
+    n and k tables are memory-mapped. Tabulated equations whose code or range
+    has changed since they were tabulated are tabulated again and saved."""
+    from .material import Material, _tabulate
+    entry = _read_index().get(name)
+    if entry is None:
+        _registry.pop(name, None)
         raise ValueError(f"ValueError: '{name}' does not exist. Initialise Material object for '{name}'.")
+    if name in _registry and _registry[name][0] == entry['version']:
+        return _registry[name][1]
+    material = object.__new__(Material)
+    material.name = name
+    material.density = entry['density']
+    material.max_temp = entry['max_temp']
+    material.abs_coeff = entry['abs_coeff']
+    regenerated = False
+    for n_or_k in ('n', 'k'):
+        filename = entry[n_or_k + '_list']
+        table = None if filename is None else np.load(_matdir().joinpath(filename), mmap_mode='r')
+        setattr(material, n_or_k + '_list', table)
+        equations = []
+        for eq_name, range, ref, *tabulated in entry[n_or_k + '_equations']:
+            func = resolve_equation(ref)
+            tabulation = None
+            if tabulated:
+                meta, = tabulated
+                path = _matdir().joinpath(meta['file'])
+                if meta['source'] == equation_source(func, range) and path.exists():
+                    tabulation = {'table': np.load(path, mmap_mode='r'),
+                                  **{key: value for key, value in meta.items() if key != 'file'}}
+                else:
+                    tabulation = _tabulate(func, range, meta['rtol'], meta['atol'])
+                    regenerated = True
+            equations.append([eq_name, tuple(range), func, tabulation])
+        setattr(material, n_or_k + '_equations', equations)
+    if regenerated:
+        save_material(material)
+        entry = _read_index()[name]
+    _registry[name] = (entry['version'], material)
+    return material
+
+def material_version(name):
+    """Return a hash of a saved material (its properties, n/k data and
+    equations), which changes whenever the material is saved with different data."""
+    entry = _read_index().get(name)
+    if entry is None:
+        raise ValueError(f"ValueError: '{name}' does not exist. Initialise Material object for '{name}'.")
+    return entry['version']
+
+def preload(names=None):
+    """Load materials into the in-memory registry. If names is None, loads every
+    saved material. Returns list of names loaded."""
+    if names is None:
+        names = list(_read_index())
+    for name in names:
+        load_material(name)
+    return list(names)
+
+def clear(name=None):
+    """Remove a material from the in-memory registry, or every material if name is None."""
+    if name is None:
+        _registry.clear()
+    else:
+        _registry.pop(name, None)
+
+def migrate_pickles(equation_paths=(), equations=None, remove=False):
+    """Convert materials saved as pkl files (by older versions) in
+    saved_materials into the store. Requires dill.
+
+    Equations that were loaded from a file were pickled by value, so their
+    source cannot be recovered from the pkl file. For each equation, the
+    source is found from (in order):
+        - equations, a dict {(material name, equation name): source}, where
+          source is as for load_equation()
+        - the module the function was defined in, if it is importable
+        - a .py file in one of equation_paths (directories) that defines a
+          function with the same code
+    If any equation cannot be found, nothing is converted.
+
+    Parameters
+    ----------
+    list of str (optional)
+        equation_paths
+            - directories searched for .py files defining equations
+    dict (optional)
+        equations
+            - explicit sources of equations
+    bool (optional)
+        remove
+            - delete pkl files once they have been converted
+    Returns
+    -------
+    list of str
+        Names of materials converted
+    """
+    import dill as pickle
+    equations = {} if equations is None else equations
+    files = sorted(mkmatdir().glob('*.pkl'))
+    materials = []
+    missing = []
+    for file in files:
+        with file.open(mode='rb') as f:
+            material = pickle.load(f)
+        for equations_list in (material.n_equations, material.k_equations):
+            for entry in equations_list:
+                eq_name, _, func = entry
+                key = (material.name, eq_name)
+                try:
+                    if key in equations:
+                        entry[2] = load_equation(equations[key])
+                    else:
+                        _equation_ref(func)
+                    continue
+                except (ValueError, ImportError, AttributeError):
+                    pass
+                for directory in equation_paths:
+                    candidates = [source for source in sorted(Path(directory).glob('*.py'))
+                                  if _defines(source, func)]
+                    if candidates:
+                        entry[2] = load_equation(candidates[0])
+                        break
+                else:
+                    missing.append(key)
+        materials.append((file, material))
+    if missing:
+        raise ValueError(f'Sources of equations {missing} not found. Give them in equations or equation_paths.')
+    for file, material in materials:
+        save_material(material)
+        if remove:
+            file.unlink()
+    return [material.name for _, material in materials]
+
+def _defines(source, func):
+    """Check if a .py file defines a function with the same code as func."""
+    try:
+        code = compile(Path(source).read_text(), str(source), 'exec')
+    except (SyntaxError, ValueError, UnicodeDecodeError):
+        return False
+    return any(const == func.__code__ for const in code.co_consts)
 
 def make_list_from_file(path_flag):
     """ Takes in the path of a CSV or txt or dat file with each entry organised as
@@ -0,0 +1,70 @@
+import hashlib
+import marshal
+import numpy as np
+from .equations import evaluate_equation
+
+""" Tabulation of expensive material equations (e.g. the Kitamura model of
+    silica) onto a dense wavelength grid, so that n/k lookups are a linear
+    interpolation instead of an evaluation of the equation.
+
+    The grid is refined adaptively until linear interpolation reproduces the
+    equation to within atol + rtol*|value| at the quarter points and midpoint
+    of every interval (checking only the midpoint misses intervals where the
+    curve crosses the chord there). Jumps in the equation (e.g. where it
+    switches between two models) cannot be resolved; they are refined down to
+    min_step and recorded.
+"""
+
+def tabulate_equation(equation, range, rtol=1e-4, atol=1e-7, initial_points=65, min_step=1e-12):
+    """ Tabulates equation over range = [start_wavelength, end_wavelength] (m).
+
+        Returns (table, info): table is an array of [wavelength, value] rows
+        (the same format as n_list/k_list), and info is a dict of rtol, atol,
+        max_error (the largest error found at the check points, excluding
+        jumps) and discontinuities (wavelengths of unresolved jumps).
+    """
+    def evaluate(wavelengths):
+        return evaluate_equation(equation, wavelengths)
+
+    start_wavelength, end_wavelength = range
+    wavelengths = np.geomspace(start_wavelength, end_wavelength, initial_points)
+    values = evaluate(wavelengths)
+    points = [(wavelengths, values)]
+    lo, hi = wavelengths[:-1], wavelengths[1:]
+    f_lo, f_hi = values[:-1], values[1:]
+    max_error = 0.0
+    discontinuities = []
+    while lo.size:
+        mid = (lo+hi)/2
+        f_mid = evaluate(mid)
+        ok = np.ones(lo.size, dtype=bool)
+        error = np.zeros(lo.size)
+        for fraction in (0.25, 0.5, 0.75):
+            f = f_mid if fraction == 0.5 else evaluate(lo + fraction*(hi-lo))
+            fraction_error = np.abs(f - ((1-fraction)*f_lo + fraction*f_hi))
+            ok &= fraction_error <= atol + rtol*np.abs(f)
+            error = np.maximum(error, fraction_error)
+        narrow = (hi-lo) <= min_step
+        if ok.any():
+            max_error = max(max_error, float(np.max(error[ok])))
+        discontinuities.extend(float(wl) for wl in mid[~ok & narrow])
+        # Split every interval that failed into two and check both
+        refine = ~ok & ~narrow
+        points.append((mid[refine], f_mid[refine]))
+        lo, hi = np.concatenate((lo[refine], mid[refine])), np.concatenate((mid[refine], hi[refine]))
+        f_lo, f_hi = np.concatenate((f_lo[refine], f_mid[refine])), np.concatenate((f_mid[refine], f_hi[refine]))
+    wavelengths = np.concatenate([wl for wl, _ in points])
+    values = np.concatenate([value for _, value in points])
+    order = np.argsort(wavelengths)
+    table = np.column_stack((wavelengths[order], values[order]))
+    info = {'rtol': rtol, 'atol': atol, 'max_error': max_error, 'discontinuities': discontinuities}
+    return table, info
+
+def equation_source(equation, range):
+    """ Hash of an equation's code and range. A table is regenerated when this
+        changes.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(marshal.dumps(equation.__code__))
+    h.update(repr([float(wl) for wl in range]).encode())
+    return h.hexdigest()
@@ -1,4 +1,6 @@
 import numpy as np
+from scipy.integrate import solve_ivp
+from Starshot.gaussbeam import find_beam_width, find_frac
 
 def differential_eq(x, sail):
     """Returns acceleration and speed of lightsail.
@@ -39,13 +41,44 @@ def differential_eq(x, sail):
     xdot = np.array([beta_dot, vel])
     return xdot
 
-def state_vs_t(sail):
+def state_vs_t(sail, method='rk4', t_eval=None, t_max=1e4, rtol=1e-8,
+                atol=(1e-12, 1e-3), stop_at_target=False, max_dist=None,
+                min_fraction=None):
     """Returns speed/distance array and corresponding time array.
 
     Parameters
     ----------
     Sail
         Instance of Sail class
+    str (optional)
+        method
+            - 'rk4' (default) uses fixed-step Runge-Kutta over the time grid.
+            - Otherwise, the name of an adaptive-step solver of
+              scipy.integrate.solve_ivp, e.g. 'RK45' or 'DOP853'.
+    array of floats (optional)
+        t_eval
+            - times [s] at which the state is returned. Defaults to a grid
+              that starts off linear and transitions into logarithmic, up
+              to t_max.
+    float (optional)
+        t_max
+            - time [s] at which integration stops, if no event occurs first
+    float (optional)
+        rtol
+            - relative tolerance of adaptive solver
+    float or tuple of two floats (optional)
+        atol
+            - absolute tolerance of adaptive solver, for [beta, distance [m]]
+    bool (optional)
+        stop_at_target
+            - adaptive only. Stop when beta reaches sail.target.
+    float (optional)
+        max_dist
+            - adaptive only. Stop when distance [m] exceeds max_dist.
+    float (optional)
+        min_fraction
+            - adaptive only. Stop when fraction of laser power incident on the
+              sail drops below min_fraction.
 
     Returns
     -------
@@ -53,11 +86,49 @@ def state_vs_t(sail):
         [[beta, distance [m]], ...]
     array of floats
         [time [s], ...]
+        If integration was stopped by an event, the last time is the time
+        of the event.
     """
     #Initialise conditions
     f = lambda t, x : differential_eq(x, sail) #Differential equation
     x0 = np.array([0,0])  #Initial state
-    t = np.append(np.linspace(0,0.8,10), np.logspace(0,4,140)) #Create time, starts off linear and transitions into logarithmic
+    if t_eval is None:
+        t = np.append(np.linspace(0,0.8,10), np.logspace(0,np.log10(t_max),140)) #Create time, starts off linear and transitions into logarithmic
+    else:
+        t = np.asarray(t_eval, dtype=float)
+    if method == 'rk4':
+        if stop_at_target or max_dist is not None or min_fraction is not None:
+            raise ValueError("Events require an adaptive method, e.g. method='RK45'")
+        return _rk4(f, x0, t), t
+
+    #Terminal events; each is zero when the event occurs
+    events = []
+    if stop_at_target:
+        reach_target = lambda t, x : x[0] - sail.target
+        reach_target.terminal = True
+        events.append(reach_target)
+    if max_dist is not None:
+        exceed_dist = lambda t, x : x[1] - max_dist
+        exceed_dist.terminal = True
+        events.append(exceed_dist)
+    if min_fraction is not None:
+        drop_fraction = lambda t, x : sail._find_fraction(x[1]) - min_fraction
+        drop_fraction.terminal = True
+        events.append(drop_fraction)
+
+    sol = solve_ivp(f, (t[0], t[-1]), x0, method=method, rtol=rtol, atol=atol,
+                    events=events, dense_output=True)
+    if not sol.success:
+        raise RuntimeError(sol.message)
+    #Evaluate dense output on the output grid, up to where integration stopped
+    t_end = sol.t[-1]
+    t = t[t < t_end]
+    t = np.append(t, t_end)
+    x = sol.sol(t)
+    return x, t
+
+def _rk4(f, x0, t):
+    """Fixed-step Runge Kutta method over the time grid t. Returns states [[beta, distance [m]], ...]."""
     x = np.zeros((x0.size,t.size))
     x[:,0] = x0 #Speed and distance
     #Runge Kutta method to find states as a function of time
@@ -70,4 +141,136 @@ def state_vs_t(sail):
         k4 = dt * f(t[i] + dt, x[:,i] + k3)
         dx = (k1 + 2*k2 + 2*k3 + k4)/6
         x[:,i+1] = x[:,i] + dx
-    return x, t
+    return x
+
+def fleet_parameters(sails):
+    """Collects the parameters of a list of sails into arrays for fleet_state_vs_t.
+
+    Parameters
+    ----------
+    list of Sail
+        Sails with power and diameter calculated
+
+    Returns
+    -------
+    dict of arrays of floats
+        Keyword arguments for fleet_state_vs_t
+    """
+    return {'mass': np.array([sail.mass for sail in sails]),
+            'power': np.array([sail.power for sail in sails]),
+            'radius': np.array([sail.radius for sail in sails]),
+            'diameter': np.array([sail.diameter for sail in sails]),
+            'wavelength': np.array([sail.wavelength for sail in sails]),
+            'reflected_factor': np.array([sail._find_effective_R() for sail in sails]),
+            'target': np.array([sail.target for sail in sails])}
+
+def fleet_differential_eq(x, mass, power, radius, diameter, wavelength, reflected_factor):
+    """Returns acceleration and speed of many lightsails at once.
+
+    Parameters
+    ----------
+    array of arrays of floats
+        x is [beta (v/c), dist [m]], each an array with one entry per sail
+    arrays of floats
+        mass [kg], laser power [W], sail radius [m], laser array diameter [m],
+        laser wavelength [m] and reflected-power factor (effective reflectance)
+        of each sail
+
+    Returns
+    -------
+    array of arrays of floats
+        [beta_dot, speed [m/s]], each an array with one entry per sail
+    """
+    c = 2.998e8 #ms^-1
+    beta, dist = x
+    tot_mass = 2 * mass #Optimal mass condition
+    beam_width = find_beam_width(diameter, wavelength, dist)
+    fraction = find_frac(radius, beam_width, dist) #fraction of power incident
+    power_ref = reflected_factor * fraction * power #W
+    lor = 1/(1-beta**2)**0.5 #Lorentz factor
+    #Derivative of state with respect to time
+    beta_dot = 2 * power_ref * (1-beta) / (tot_mass * c**2 * lor**3 * (1+beta))
+    vel = c*beta
+    return np.array([beta_dot, vel])
+
+def fleet_state_vs_t(mass, power, radius, diameter, wavelength, reflected_factor,
+                     target=None, max_dist=None, t_eval=None, t_max=1e4):
+    """Integrates the trajectories of N sails simultaneously, using the
+    Runge-Kutta method on one (2, N) state array. Each sail stops
+    independently when it reaches its target speed or maximum distance.
+
+    Parameters
+    ----------
+    floats or arrays of floats
+        mass [kg], power [W], radius [m], diameter [m] (of laser array),
+        wavelength [m] and reflected_factor (effective reflectance, see
+        Sail._find_effective_R) of each sail. Broadcast against each other.
+        fleet_parameters() builds these from a list of sails.
+    float or array of floats (optional)
+        target
+            - stop each sail when beta reaches its target
+    float or array of floats (optional)
+        max_dist
+            - stop each sail when its distance [m] exceeds max_dist
+    array of floats (optional)
+        t_eval
+            - time grid [s]. Defaults to the same grid as state_vs_t.
+    float (optional)
+        t_max
+            - end of default time grid [s]
+
+    Returns
+    -------
+    array of floats
+        states with shape (2, N, len(t)): [beta, distance [m]]. States after
+        a sail has stopped are NaN.
+    array of floats
+        [time [s], ...]
+    array of floats
+        time [s] at which each sail stopped, found by linear interpolation
+        within the step. NaN if the sail did not stop.
+    array of floats
+        state [beta, distance [m]] of each sail when it stopped, shape (2, N);
+        the final state if it did not stop.
+    """
+    params = np.broadcast_arrays(*[np.atleast_1d(np.asarray(p, dtype=float)) for p in
+        (mass, power, radius, diameter, wavelength, reflected_factor)])
+    N = params[0].size
+    target = np.broadcast_to(np.inf if target is None else target, (N,))
+    max_dist = np.broadcast_to(np.inf if max_dist is None else max_dist, (N,))
+    if t_eval is None:
+        t = np.append(np.linspace(0,0.8,10), np.logspace(0,np.log10(t_max),140))
+    else:
+        t = np.asarray(t_eval, dtype=float)
+    x = np.full((2, N, t.size), np.nan)
+    x[:,:,0] = 0
+    t_stop = np.full(N, np.nan)
+    x_stop = np.zeros((2, N))
+    active = np.arange(N) #Indices of sails still moving
+    for i in range(t.size - 1):
+        if active.size == 0:
+            break
+        p = [param[active] for param in params]
+        f = lambda state : fleet_differential_eq(state, *p)
+        dt = t[i+1] - t[i]
+        xi = x[:,active,i]
+        k1 = dt * f(xi)
+        k2 = dt * f(xi + k1/2)
+        k3 = dt * f(xi + k2/2)
+        k4 = dt * f(xi + k3)
+        xn = xi + (k1 + 2*k2 + 2*k3 + k4)/6
+        #Per-sail termination; interpolate to the crossing within the step
+        over_target = xn[0] >= target[active]
+        over_dist = xn[1] >= max_dist[active]
+        stopped = over_target | over_dist
+        frac = np.ones(active.size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(over_target, np.minimum(frac, (target[active] - xi[0])/(xn[0] - xi[0])), frac)
+            frac = np.where(over_dist, np.minimum(frac, (max_dist[active] - xi[1])/(xn[1] - xi[1])), frac)
+        stop_idx = active[stopped]
+        t_stop[stop_idx] = t[i] + frac[stopped]*dt
+        x_stop[:,stop_idx] = xi[:,stopped] + frac[stopped]*(xn[:,stopped] - xi[:,stopped])
+        x[:,active[~stopped],i+1] = xn[:,~stopped]
+        active = active[~stopped]
+    x_stop[:,active] = x[:,active,-1]
+    return x, t, t_stop, x_stop
@@ -1,17 +1,182 @@
 from Starshot.sail import Sail
-from Starshot.tmm.tmm import tmm
-from Starshot.materials.save_load_mat import load_material
+from Starshot.tmm.tmm import tmm, tmm_batch, tmm_both_sides, tmm_gradient, Periodic, IncrementalTMM
+from Starshot.materials.save_load_mat import load_material, material_version
+from Starshot.result_cache import get_result_cache
+from Starshot.spectral_response import SpectralResponse
 import scipy
 import scipy.integrate as integrate
+from scipy.interpolate import PchipInterpolator
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 from numpy import sin, cos, pi
 from copy import deepcopy
+import warnings
+
+def _planck(wavelength, temperature):
+    """Spectral radiance of a black body [W sr^-1 m^-3] (Planck's law)."""
+    h = 6.62607004e-34       # Planck's constant in SI
+    c = 299792458             # speed of light in SI
+    k_B = 1.38064852e-23        # Boltzmann constant in SI
+    return ((2*h*c**2)/wavelength**5)*(1/(np.exp(h*c/(wavelength*k_B*temperature))-1))
+
+def _angular_quadrature(quadrature, points):
+    """ Nodes and weights for integrating directional emissivity over the
+    hemisphere, i.e. hemispherical emissivity = sum(weights*emissivity(angles)).
+    The weights include the factor of 2*cos(theta)*sin(theta).
+
+    Parameters
+    ----------
+    str
+        quadrature
+            - 'gauss': Gauss-Legendre rule in cos(theta). Since
+              2*cos(theta)*sin(theta) dtheta = 2*mu dmu with mu = cos(theta),
+              the integrand is smooth and theta = pi/2 (where the TMM is
+              near-singular) is never evaluated.
+            - 'trapz': trapezoidal rule on evenly spaced angles in [0, pi/2]
+    int
+        points
+            - number of angles
+    Returns
+    -------
+    array of floats
+        angles [radians]
+    array of floats
+        weights
+    """
+    if quadrature == 'gauss':
+        x, w = np.polynomial.legendre.leggauss(points)
+        mu = (x + 1)/2      # map [-1, 1] to [0, 1]
+        return np.arccos(mu), w/2*2*mu
+    elif quadrature == 'trapz':
+        angles = np.linspace(0,pi/2,points)
+        w = np.full(points, angles[1] - angles[0])
+        w[[0, -1]] /= 2
+        return angles, w*2*cos(angles)*sin(angles)
+    raise ValueError("quadrature must be 'gauss' or 'trapz'")
+
+def _power_emitted(T, wavelengths, weights, emissivity):
+    """Power emitted per unit area by sails at temperature(s) T [K], given
+    their front plus back hemispherical emissivity at the wavelengths of a
+    quadrature (see MultilayerSail._emission_quadrature), with shape
+    (..., wavelengths). T broadcasts against the leading axes of emissivity.
+    """
+    T = np.asarray(T, dtype=float)[..., None]
+    return np.sum(weights*pi*_planck(wavelengths, T)*emissivity, axis=-1)
+
+def _equilibrium_temperature(power_absorbed, wavelengths, weights, emissivity, rtol=1e-8):
+    """Temperatures at which sails emit the power they absorb, by bisection on
+    all sails at once.
+
+    Parameters
+    ----------
+    array of floats
+        power_absorbed
+            - power absorbed per unit area of each sail []
+    array of floats
+        wavelengths
+            - wavelengths of the emissivity spectra [m]
+    array of floats
+        weights
+            - quadrature weights of the wavelengths [m] (see
+              MultilayerSail._emission_quadrature)
+    array of floats
+        emissivity
+            - front plus back hemispherical emissivity of each sail at each
+              wavelength, shape (sails, wavelengths)
+    Returns
+    -------
+    array of floats
+        equilibrium temperature of each sail [K]
+    """
+    def power_emitted(T):
+        return _power_emitted(T, wavelengths, weights, emissivity)
+    # Emitted power increases with temperature and is at most that of a black
+    # body on both faces, so the black body temperature is a lower bound
+    a = (np.asarray(power_absorbed, dtype=float)/(2*5.67e-8))**0.25
+    b = 2*a
+    low = power_emitted(b) < power_absorbed
+    while low.any():
+        b[low] *= 2
+        low = power_emitted(b) < power_absorbed
+    while np.any(b - a > rtol*b):
+        T = (a+b)/2
+        below = power_emitted(T) < power_absorbed
+        a = np.where(below, T, a)
+        b = np.where(below, b, T)
+    return (a+b)/2
+
+def _W_per_root_density(target):
+    """W (see Sail._find_W) of a sail with reflectance 1 and surface density
+    1 g/m^2 [sqrt(g)/m]; W scales with sqrt(s_density)/reflectance."""
+    def dW(beta):
+        gamma = 1/np.sqrt(1-beta**2)
+        return (gamma*beta)/(1-beta)**2
+    W_per_root_density, _ = integrate.quad(dW, 0, target)
+    return W_per_root_density
+
+def _reflectance_derivative(r_p, r_s, dr_p, dr_s):
+    """Derivative of R = (|r_p|^2 + |r_s|^2)/2 given derivatives of r_p and r_s."""
+    return (np.conj(r_p)*dr_p + np.conj(r_s)*dr_s).real
+
+def _emissivity_derivative(r_p, t_p, r_s, t_s, gradients):
+    """Derivative of 1 - R - T with respect to each layer thickness, given the
+    tmm_gradient derivatives with respect to (negative) distance d, with shape
+    (layers, 4, ...)."""
+    dR = _reflectance_derivative(r_p, r_s, gradients[:,0], gradients[:,2])
+    dT = _reflectance_derivative(t_p, t_s, gradients[:,1], gradients[:,3])
+    # Structure uses negative thicknesses, so d(thickness) = -d(d)
+    return dR + dT
+
+def _spectral_response(bandwidth, coefficients):
+    """SpectralResponse from the coefficients of the stacked structure of
+    MultilayerSail._spectral_structure."""
+    r_p, t_p, r_s, t_s = coefficients
+    R = ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real
+    T = ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2).real
+    return SpectralResponse(bandwidth, R[0], T[0], 1 - R[1] - T[1])
+
+def _freeze(value):
+    """Hashable, comparable copy of a value (lists and arrays become tuples)."""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class _Lazy:
+    """Sail variable that is calculated when it is first read, and kept (with
+    the values of the variables it depends on) until one of those changes.
+    Changing e.g. power only recalculates the variables that depend on power."""
+    def __init__(self, find, depends_on):
+        self.find = find
+        self.depends_on = depends_on
+        self.name = find.__name__
+        self.__doc__ = find.__doc__
+
+    def __get__(self, sail, owner=None):
+        if sail is None:
+            return self
+        key = tuple(_freeze(getattr(sail, variable)) for variable in self.depends_on)
+        cache = sail.__dict__.get('_lazy_' + self.name)
+        if cache is None or cache[0] != key:
+            cache = (key, self.find(sail))
+            sail.__dict__['_lazy_' + self.name] = cache
+        return cache[1]
+
+    def __set__(self, sail, value):
+        raise AttributeError(f"'{self.name}' is calculated; change the variables it depends on instead")
+
+def _lazy(*depends_on):
+    """Decorator that makes a method into a _Lazy variable depending on depends_on."""
+    return lambda find: _Lazy(find, depends_on)
 
 class MultilayerSail(Sail):
     """
     Multilayer lightsails.
+
+    Only the inputs are set by the constructor. Every other variable (e.g.
+    reflectance, power, temp_reached, W, diameter) is calculated when it is
+    first read, and kept until a variable it depends on changes. E.g. changing
+    power recalculates temp_reached and diameter, but not the reflectance.
     ...
     Attributes
     ----------
@@ -47,12 +212,23 @@ class MultilayerSail(Sail):
         List of strings representing the materials in each layer
     thickness : list (of floats)
         Thickness of layers [m]
+    period : tuple of three ints
+        (start, stop, repeats): layers start to stop-1 are a unit cell that
+        is repeated repeats times. None if the sail is not periodic.
     max_temp : float
         Maximum temperature of sail [K]
     abs_coeff : float
         Absorption coefficient of lightsail. [cm^-1]
     absorptance : float
         Absolute absorption of lightsail
+    angular_points : int
+        Number of angles used to integrate directional emissivity over the hemisphere
+    angular_quadrature : str
+        Quadrature rule for the hemispherical integration, 'gauss' or 'trapz'
+    emission_range : tuple of two floats
+        Wavelength range over which emitted power is integrated [m]
+    emission_rtol : float
+        Relative tolerance of the emitted power integration
     Methods (for user)
     ------------------
     def __init__(   name=None, materials=None, mass=None, thickness=None,
@@ -72,7 +248,9 @@ class MultilayerSail(Sail):
         speed vs distance and speed vs time graphs.
     """
     def __init__(   self, name=None, materials=None, mass=None, thickness=None, area=None,
-                    target=0.2, max_Starchip_temp=1000, power=None, wavelength=1.064e-6):
+                    target=0.2, max_Starchip_temp=1000, power=None, wavelength=1.064e-6,
+                    angular_points=16, angular_quadrature='gauss', emission_range=(1e-6, 25e-6),
+                    emission_rtol=1e-4, period=None, verbose=True):
         """The constructor for MultilayerSail class
         Parameters
         ----------
@@ -96,79 +274,395 @@ class MultilayerSail(Sail):
             Laser power [W]
         wavelength : float
             Laser wavelength [m]
+        angular_points : int
+            Number of angles used to integrate directional emissivity over the
+            hemisphere. Fewer points for draft runs, more for precise runs.
+        angular_quadrature : str
+            'gauss' (Gauss-Legendre in cos(theta)) or 'trapz' (trapezoidal in theta)
+        emission_range : tuple of two floats
+            Wavelength range over which emitted power is integrated [m]
+        emission_rtol : float
+            Relative tolerance of the emitted power integration
+        period : tuple of three ints
+            (start, stop, repeats) for a periodic sail: materials[start:stop]
+            (and their thicknesses) are a unit cell that is repeated repeats
+            times. Layers before start and from stop on are cap layers. Each
+            layer is listed once in materials and thickness.
+        verbose : bool
+            Print progress and the variables of the sail
         Returns
         -------
         MultilayerSail
             MultilayerSail with variables specified by user
         """
+        self._verbose = verbose
+        if name is None:
+            raise ValueError("Enter name")
+        self.name = name #Unique code that identifies the sail
         if materials is None:
             raise ValueError("Enter material(s)")
         self.materials = materials
+        self._material_objects() #Resolve material objects once
         if thickness is None:
             raise ValueError("Enter thickness(es)")
         self.thickness = thickness #m
-        self.s_density = self._find_SA_density()
+        if period is not None:
+            start, stop, repeats = period
+            if not 0 <= start < stop <= len(materials) or repeats < 1:
+                raise ValueError("period must be (start, stop, repeats) with 0 <= start < stop <= number of layers and repeats >= 1")
+            period = (int(start), int(stop), int(repeats))
+        self.period = period
+        self.angular_points = angular_points
+        self.angular_quadrature = angular_quadrature
+        self.emission_range = emission_range #m
+        self.emission_rtol = emission_rtol
+        #Whichever of mass and area is given is kept fixed; the other follows the surface density
         if area is None and mass is None:
             raise ValueError("Enter mass and/or area")
-        elif area is None:
-            area = mass / self.s_density
-        elif mass is None:
-            mass = area * self.s_density
-        reflectance = None #To pass into sail constructor.
-        super().__init__(name, mass, area, reflectance, target, power, wavelength)
+        self._mass = mass #kg
+        self._area = area #m^2
+        self.target = target #c
+        self.power = power #W
+        self.wavelength = wavelength #m
         self.max_Starchip_temp = max_Starchip_temp #K
-        self.absorptance = self._find_absorptance()
-        if self.power is None:
-            self.power = self._find_max_power() #Estimate max power that sail can use.
-            self.temp_reached = min([mat.get_max_temp() for mat in self._material_objects()] + [self.max_Starchip_temp])
-        else:
-            print('Calculating temperature...')
-            self.temp_reached = self._find_eq_temps_given_abs_coeff()
-            print(f'Temperature reached = {self.temp_reached}')
-        if self.reflectance is None:
-            self.reflectance = self._find_reflectance()
-        if self.transmittance is None:
-            self.transmittance = self._find_transmittance()
-        self.angles_coeffs = [(0, self.reflectance, self.transmittance)]
-        self.W = self._find_W()
-        self.diameter = self._find_diameter()
-        self._reorder_vars()
-        self.print_variables()
-
-    def _reorder_vars(self):
-        """Reorder variables to make it print nicer"""
-        old_vars = vars(self)
-        new_order = ['name','mass','area','radius','materials','thickness','s_density',
+        #Everything else is calculated when it is first read (see _lazy)
+        if verbose:
+            self.print_variables()
+
+    #Variables in the order they are printed
+    _VARIABLES = ['name','mass','area','radius','materials','thickness','period','s_density',
         'absorptance', 'reflectance','transmittance', 'angles_coeffs','target','power',
-        'wavelength', 'diameter', 'W','max_Starchip_temp', 'temp_reached']
-        new_vars = {lab: old_vars[lab] for lab in new_order}
-        self.__dict__ = new_vars
+        'wavelength', 'diameter', 'W','max_Starchip_temp', 'temp_reached',
+        'angular_points', 'angular_quadrature', 'emission_range', 'emission_rtol']
+
+    #Number of thermal queries on the same structure after which the emitted
+    #power curve is built (see _power_emitted_curve)
+    _CURVE_QUERIES = 4
+
+    #Variables that the thermal calculations depend on
+    _THERMAL = ('materials', '_material_versions', 'thickness', 'period', 'mass', 'area', 'wavelength', 'target',
+        'max_Starchip_temp', 'angular_points', 'angular_quadrature', 'emission_range', 'emission_rtol')
+
+    def _variables(self):
+        """List of (variable, value) of the sail, calculating any that have not been."""
+        return [(variable, getattr(self, variable)) for variable in self._VARIABLES]
+
+    @property
+    def mass(self):
+        """Mass of lightsail (excluding payload) [kg]. Follows the surface
+        density if the area was given instead."""
+        if self._mass is None:
+            return self._area*self.s_density
+        return self._mass
+
+    @mass.setter
+    def mass(self, mass):
+        self._mass = mass
+        self._area = None
+
+    @property
+    def area(self):
+        """Area of lightsail [m^2]. Follows the surface density if the mass was
+        given instead."""
+        if self._area is None:
+            return self._mass/self.s_density
+        return self._area
+
+    @area.setter
+    def area(self, area):
+        self._area = area
+        self._mass = None
+
+    @property
+    def power(self):
+        """Laser power [W]. If set to None, the max power the sail can be subject to."""
+        if self._power is None:
+            return self._max_power
+        return self._power
+
+    @power.setter
+    def power(self, power):
+        self._power = power
+
+    @_lazy('materials', '_material_versions', 'thickness', 'period')
+    def s_density(self):
+        """Surface density of lightsail [kg/m^2]"""
+        return self._find_SA_density()
+
+    @_lazy('area')
+    def radius(self):
+        """Radius of lightsail [m]"""
+        return np.sqrt(self.area/np.pi)
+
+    @_lazy('materials', '_material_versions', 'thickness', 'period', 'wavelength', 'target')
+    def absorptance(self):
+        """Absolute absorption of lightsail at the laser wavelength"""
+        return self._disk_cached('absorptance', lambda: self._find_spectral_response().absorptance_at(0))
+
+    @_lazy('materials', '_material_versions', 'thickness', 'period', 'wavelength', 'target')
+    def reflectance(self):
+        """Absolute reflectance of lightsail, averaged over the Doppler-shifted band"""
+        return self._disk_cached('reflectance', self._find_reflectance)
+
+    @_lazy('materials', '_material_versions', 'thickness', 'period', 'wavelength', 'target')
+    def transmittance(self):
+        """Absolute transmittance of lightsail, averaged over the Doppler-shifted band"""
+        return self._disk_cached('transmittance', self._find_transmittance)
+
+    @_lazy('reflectance', 'transmittance')
+    def angles_coeffs(self):
+        """Angle [degrees], reflection efficiency and transmission efficiency of each order"""
+        return [(0, self.reflectance, self.transmittance)]
+
+    @_lazy('angles_coeffs', 's_density', 'wavelength', 'target')
+    def W(self):
+        """Square root of RAAD, W [sqrt(g)/m]"""
+        return self._find_W()
+
+    @_lazy('W', 'mass', 'power', 'wavelength')
+    def diameter(self):
+        """Diameter of laser array [m]"""
+        return self._find_diameter()
+
+    @_lazy(*_THERMAL)
+    def _max_power(self):
+        """Max power the sail can be subject to [W] (see _find_max_power)"""
+        return self._disk_cached('power', self._find_max_power, '_max_power')
+
+    @_lazy('_power', *_THERMAL)
+    def temp_reached(self):
+        """Maximum temperature reached on the journey [K]. If power is not
+        given, the max temperature of the materials and Starchip."""
+        if self._power is None:
+            return self._find_max_temp()
+        def find_temp():
+            if self._verbose:
+                print('Calculating temperature...')
+            temp = self._find_eq_temps_given_abs_coeff()
+            if self._verbose:
+                print(f'Temperature reached = {temp}')
+            return temp
+        return self._disk_cached('temp_reached', find_temp)
+
+    def _disk_cached(self, variable, find, lazy = None):
+        """Look variable up in the on-disk result cache (see result_cache.py) if
+        it is enabled, otherwise (or if it is not there) calculate it with find().
+        It is keyed only on the variables that the _Lazy variable lazy (defaults
+        to variable) depends on, so e.g. the reflectance is found once for a
+        sweep of mass or power."""
+        cache = get_result_cache()
+        if cache is None:
+            return find()
+        depends_on = getattr(type(self), variable if lazy is None else lazy).depends_on
+        key = cache.make_key({**self._result_cache_inputs(depends_on), 'variable': variable})
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[variable]
+        value = find()
+        cache.put(key, {variable: float(value)})
+        return value
+
+    def _result_cache_inputs(self, depends_on):
+        """Values (json-serialisable) of the variables depends_on, which the
+        cached results (see result_cache.py) depend on. _power is None if it
+        is to be the max power."""
+        inputs = {}
+        for variable in depends_on:
+            value = getattr(self, variable)
+            if isinstance(value, (list, tuple)):
+                value = [v if isinstance(v, str) else float(v) for v in value]
+            elif isinstance(value, (int, float, np.number)):
+                value = float(value)
+            inputs[variable] = value
+        return inputs
 
     def _material_objects(self):
-        """Convert list of material tags to material objects"""
+        """Convert list of material tags to material objects. Objects are
+        resolved once and kept, with the versions they were loaded at, until
+        the list of material tags changes or a material is saved again."""
+        cache = getattr(self, '_material_cache', None)
         try:
-            mats = [load_material(mat) for mat in self.materials]
+            versions = tuple(material_version(mat) for mat in self.materials)
+            if cache is None or cache[0] != tuple(self.materials) or cache[1] != versions:
+                mats = [load_material(mat) for mat in self.materials]
+                #Loading can save a material again (e.g. a regenerated table)
+                versions = tuple(material_version(mat) for mat in self.materials)
+                cache = (tuple(self.materials), versions, mats)
+                self._material_cache = cache
         except ValueError:
             raise ValueError('Check that materials have been initialised and saved in saved_materials')
-        return mats
+        return cache[2]
+
+    @property
+    def _material_versions(self):
+        """Versions (see save_load_mat.material_version) of the material
+        objects the sail uses. Calculated variables and cached results depend
+        on these, so they are recalculated when a material is saved again."""
+        self._material_objects()
+        return self._material_cache[1]
+
+    def tolerance_analysis(self, n_samples=1000, thickness_error=0.02, abs_coeff_error=0.0, n_error=0.0,
+                           seed=None, **options):
+        """Monte Carlo analysis of fabrication errors in the thicknesses,
+        absorption coefficients and refractive indices of the layers. Samples
+        are evaluated in batches without constructing a sail for each (see
+        tolerance.tolerance_analysis for the parameters and options).
+        Returns
+        -------
+        ToleranceResult
+            Perturbations, reflectance, absorptance, temperature, W and
+            acceleration distance of every sample, and the yield
+        """
+        from Starshot.tolerance import tolerance_analysis
+        return tolerance_analysis(self, n_samples, thickness_error, abs_coeff_error, n_error, seed, **options)
 
+    def _find_batch_optics(self, thickness, abs_coeff = None, n_shift = None, batch_size = 128, emission_quadrature = None):
+        """Calculates the optics of many variants of the MultilayerSail, with
+        the same materials but different thicknesses (and optionally
+        absorption coefficients and refractive indices), in batches of one TMM
+        call each for the laser band and the thermal emission. Material data
+        is looked up once.
+        Parameters
+        ----------
+        array of floats
+            thickness
+                - thickness of each layer of each variant [m], shape (variants, layers)
+        array of floats (optional)
+            abs_coeff
+                - absorption coefficient of each layer of each variant
+                  [cm^-1]. Defaults to those of the materials.
+        array of floats (optional)
+            n_shift
+                - change in the real refractive index of each layer of each
+                  variant in the laser band. Defaults to 0.
+        int (optional)
+            batch_size
+                - number of variants in each TMM call
+        tuple of two arrays of floats (optional)
+            emission_quadrature
+                - wavelengths and weights (see _emission_quadrature) at which
+                  the emissivity is found. Defaults to the quadrature of this
+                  sail at its max temperature.
+        Returns
+        -------
+        dict
+            'bandwidth': wavelengths across the Doppler-shifted laser band [m],
+            'reflectance' and 'transmittance': averaged over the band,
+            'absorptance': at each wavelength of the band,
+            'betas': speeds through the journey (as in
+            _find_absorbed_power_per_watt), 'beta_absorptance': absorptance
+            at the laser wavelength Doppler-shifted to each speed,
+            'emission_wavelengths' and 'emission_weights': the emission
+            quadrature [m], 'emissivity': front plus back hemispherical
+            emissivity at each emission wavelength. Arrays have one row per
+            variant.
+        """
+        materials = self._material_objects()
+        thickness = np.asarray(thickness, dtype=float)
+        variants, layers = thickness.shape
+        if abs_coeff is None:
+            abs_coeff = np.tile([material.get_abs_coeff() for material in materials], (variants, 1))
+        if n_shift is None:
+            n_shift = np.zeros((variants, layers))
+        wavelength, target = self.wavelength, self.target
+        bandwidth = np.linspace(wavelength, wavelength*np.sqrt((1+target)/(1-target)), 100)
+        if emission_quadrature is None:
+            emission_quadrature = self._emission_quadrature(self._find_max_temp())
+        emission_wavelengths, emission_weights = emission_quadrature
+        angles, weights = _angular_quadrature(self.angular_quadrature, self.angular_points)
+        n_laser = [material.get_nk(wavelength) for material in materials]
+        n_band = [material.get_n(bandwidth) for material in materials]
+        n_emission = [material.get_nk(emission_wavelengths)[:, None] for material in materials]
 
-    def _find_structure(self, wavelength = None):
+        reflectance = np.empty(variants)
+        transmittance = np.empty(variants)
+        absorptance = np.empty((variants, bandwidth.size))
+        emissivity = np.empty((variants, emission_wavelengths.size))
+        for start in range(0, variants, batch_size):
+            batch = slice(start, start + batch_size)
+            d = -thickness[batch]
+            # Laser band, stacked as in _spectral_structure
+            structure = []
+            for j in range(layers):
+                n = n_laser[j] + n_shift[batch, j, None]
+                k = 1j*bandwidth*100*abs_coeff[batch, j, None]/(4*pi)   # conversion from abs_coeff to extinction coeff
+                n_near_IR = n_band[j] + n_shift[batch, j, None] + k
+                structure.append((np.stack(np.broadcast_arrays(n, n_near_IR)), d[:, j, None]))
+            r_p, t_p, r_s, t_s = tmm_batch(self._group_periodic(structure), bandwidth, 0)
+            R = ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real
+            T = ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2).real
+            reflectance[batch] = np.mean(R[0], axis=-1)
+            transmittance[batch] = np.mean(T[0], axis=-1)
+            absorptance[batch] = 1 - R[1] - T[1]
+            # Hemispherical emissivity of both faces
+            structure = [(n_emission[j], d[:, j, None, None]) for j in range(layers)]
+            total = 0
+            for r_p, t_p, r_s, t_s in tmm_both_sides(self._group_periodic(structure), emission_wavelengths[:, None], angles):
+                R = ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real
+                T = ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2).real
+                total = total + np.sum((1-R-T)*weights, axis=-1)
+            emissivity[batch] = total
+        betas = np.linspace(0, target, 100)
+        shifted = wavelength*np.sqrt((1+betas)/(1-betas))
+        beta_absorptance = np.array([np.interp(shifted, bandwidth, A) for A in absorptance]).reshape(variants, betas.size)
+        return {'bandwidth': bandwidth, 'reflectance': reflectance, 'transmittance': transmittance,
+                'absorptance': absorptance, 'betas': betas, 'beta_absorptance': beta_absorptance,
+                'emission_wavelengths': emission_wavelengths, 'emission_weights': emission_weights,
+                'emissivity': emissivity}
+
+    def _layer_copies(self):
+        """Number of times each layer appears in the sail: repeats for layers
+        of the unit cell of a periodic sail, otherwise 1."""
+        copies = np.ones(len(self.thickness), dtype=int)
+        if self.period is not None:
+            start, stop, repeats = self.period
+            copies[start:stop] = repeats
+        return copies
+
+    def _group_periodic(self, structure):
+        """Replaces the unit cell of a periodic sail in a list of (n, d) of
+        each layer with one Periodic element (see tmm.tmm), so its matrix is
+        found once and raised to the power of the number of repeats."""
+        if self.period is None:
+            return structure
+        start, stop, repeats = self.period
+        return structure[:start] + [Periodic(structure[start:stop], repeats)] + structure[stop:]
+
+    def _fold_gradient(self, gradient):
+        """Sums derivatives with respect to every layer of the expanded
+        structure (first axis) onto the layers of the sail, so a layer of the
+        unit cell gets the derivative for changing it in every repeat."""
+        if self.period is None:
+            return gradient
+        start, stop, repeats = self.period
+        end = start + (stop-start)*repeats
+        cell = gradient[start:end].reshape((repeats, stop-start) + gradient.shape[1:]).sum(axis=0)
+        return np.concatenate((gradient[:start], cell, gradient[end:]))
+
+    def _find_structure(self, wavelength = None, periodic = True):
         """Creates a list representing the structure of the MultilayerSail.
         Parameters
         ----------
-        None required
+        float or array of floats (optional)
+            wavelength [m]
+        bool (optional)
+            periodic
+                - if False, the unit cell of a periodic sail is not grouped,
+                  so there is one tuple per layer of materials
         Returns
         -------
         list of tuples of two floats
             [(refractive index, -thickness [m]), ...]
+            If wavelength is an array, each refractive index is an array of
+            the same shape. The unit cell of a periodic sail is a Periodic
+            element.
         """
-        if wavelength == None:
+        if wavelength is None:
             wavelength = self.wavelength
         structure = []
         for material, thickness in zip(self._material_objects(), self.thickness):
-            structure.append( (material.get_n(wavelength) + 1j*material.get_k(wavelength), -thickness) )
-        return structure
+            structure.append( (material.get_nk(wavelength), -thickness) )
+        return self._group_periodic(structure) if periodic else structure
 
     def _find_SA_density(self):
         """ Determines the surface area density of the sail given its structure
@@ -182,10 +676,34 @@ class MultilayerSail(Sail):
                 surface area density [kg m-2]
         """
         SA_density = 0
-        for material, thickness in zip(self._material_objects(), self.thickness):
-            SA_density += material.get_density()*thickness
+        for material, thickness, copies in zip(self._material_objects(), self.thickness, self._layer_copies()):
+            SA_density += material.get_density()*thickness*copies
         return SA_density
 
+    def _find_structure_near_IR(self, wavelength = None, periodic = True):
+        """Creates a list representing the structure of the MultilayerSail in
+        the laser band, where the extinction coefficient of each material is
+        found from its absorption coefficient (material.abs_coeff attribute).
+        Parameters
+        ----------
+        float or array of floats (optional)
+            wavelength [m]
+        bool (optional)
+            periodic
+                - as for _find_structure
+        Returns
+        -------
+        list of tuples of two floats
+            [(refractive index, -thickness [m]), ...]
+        """
+        if wavelength is None:
+            wavelength = self.wavelength
+        structure_near_IR = []
+        for material, thickness in zip(self._material_objects(), self.thickness):
+            k = 1j*wavelength*100*material.get_abs_coeff()/(4*pi)   # conversion from abs_coeff to extinction coeff
+            structure_near_IR.append( (material.get_n(wavelength) + k, -thickness) )
+        return self._group_periodic(structure_near_IR) if periodic else structure_near_IR
+
     def _find_absorptance(self, wavelength = None):
         """Calculates absorptance of MultilayerSail based on the (expected)
         absorption coefficients of the sail materials (material.abs_coeff
@@ -207,10 +725,7 @@ class MultilayerSail(Sail):
         """
         if wavelength is None:
             wavelength = self.wavelength
-        structure_near_IR = []
-        for material, thickness in zip(self._material_objects(), self.thickness):
-            k = 1j*wavelength*100*material.get_abs_coeff()/(4*pi)   # conversion from abs_coeff to extinction coeff
-            structure_near_IR.append( (material.get_n(wavelength) + k, -thickness) )
+        structure_near_IR = self._find_structure_near_IR(wavelength)
 
         r_p, t_p, r_s, t_s = tmm(structure_near_IR, wavelength, 0)
 
@@ -219,6 +734,95 @@ class MultilayerSail(Sail):
         A = 1 - R - T
         return A
 
+    def _find_spectral_response(self, points = 100):
+        """Calculates the reflectance, transmittance and absorptance of the
+        MultilayerSail over the Doppler-shifted laser band in one batched TMM
+        pass. The response is cached on the sail; changing the materials,
+        thicknesses, wavelength or target recalculates it.
+        Parameters
+        ----------
+        int (optional)
+            points
+                - number of wavelengths across the band
+        Returns
+        -------
+        SpectralResponse
+            Response of MultilayerSail across the band
+        """
+        key = (tuple(self.materials), self._material_versions, tuple(self.thickness), self.period, self.wavelength,
+                self.target, points)
+        cache = getattr(self, '_spectral_response_cache', None)
+        if cache is None or cache[0] != key:
+            bandwidth, structure = self._spectral_structure(points)
+            response = _spectral_response(bandwidth, tmm_batch(self._group_periodic(structure), bandwidth, 0))
+            cache = (key, response)
+            self._spectral_response_cache = cache
+        return cache[1]
+
+    def _spectral_structure(self, points):
+        """Wavelengths across the Doppler-shifted laser band, and the structure
+        used for the spectral response (one tuple per layer of materials).
+        Reflectance and transmittance use the optical constants at the laser
+        wavelength; absorptance uses the absorption coefficients at each
+        wavelength. Both structures are stacked along the first axis so the
+        whole band is one TMM call."""
+        #Get parameters
+        wavelength = self.wavelength
+        target = self.target
+        shift = np.sqrt((1+target)/(1-target))
+        bandwidth = np.linspace(wavelength, wavelength*shift, points)
+        structure = [(np.stack(np.broadcast_arrays(n, n_near_IR)), d) for (n, d), (n_near_IR, _)
+                        in zip(self._find_structure(periodic=False), self._find_structure_near_IR(bandwidth, periodic=False))]
+        return bandwidth, structure
+
+    def with_thickness(self, layer, thickness, points = 100):
+        """Calculates the response of the MultilayerSail over the laser band
+        (see _find_spectral_response) if layer had the given thickness,
+        without changing the sail.
+
+        The products of the layer matrices before and after each layer are
+        kept (see tmm.tmm.IncrementalTMM), so only the matrix of the changed
+        layer (or of the unit cell, if the layer is in it) is recalculated,
+        whatever the number of layers. The products are found on the first
+        call and kept until the sail changes, so scanning one thickness after
+        another (e.g. coordinate descent or sensitivity analysis) is cheap.
+        Parameters
+        ----------
+        int
+            layer
+                - index of the layer in materials/thickness
+        float
+            thickness
+                - new thickness of the layer [m]
+        int (optional)
+            points
+                - number of wavelengths across the band
+        Returns
+        -------
+        SpectralResponse
+            Response of MultilayerSail across the band, with the new thickness
+        """
+        layer = range(len(self.thickness))[layer]
+        key = (tuple(self.materials), self._material_versions, tuple(self.thickness), self.period, self.wavelength,
+                self.target, points)
+        cache = getattr(self, '_incremental_cache', None)
+        if cache is None or cache[0] != key:
+            bandwidth, structure = self._spectral_structure(points)
+            cache = (key, (bandwidth, structure, IncrementalTMM(self._group_periodic(structure), bandwidth, 0)))
+            self._incremental_cache = cache
+        bandwidth, structure, evaluator = cache[1]
+        structure = list(structure)
+        structure[layer] = (structure[layer][0], -thickness)
+        # Index and new value of the changed element of the grouped structure
+        element, params = layer, structure[layer]
+        if self.period is not None:
+            start, stop, repeats = self.period
+            if start <= layer < stop:
+                element, params = start, Periodic(structure[start:stop], repeats)
+            elif layer >= stop:
+                element = layer - (stop-start) + 1
+        return _spectral_response(bandwidth, evaluator.replace(element, params))
+
     def _find_reflectance(self):
         """Calculates reflectance of MultilayerSail, averaged over wavelength.
         Parameters
@@ -229,18 +833,7 @@ class MultilayerSail(Sail):
         float
             Reflectance of MultilayerSail
         """
-        #Get parameters
-        wavelength = self.wavelength
-        target = self.target
-        structure = self._find_structure()
-        shift = np.sqrt((1+target)/(1-target))
-        bandwidth = np.linspace(wavelength, wavelength*shift, 100)
-        R_all = []
-        for b in bandwidth:
-            r_p, _, r_s, _ = tmm(structure, b, 0)
-            R_all.append( ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2) )
-        R_avg = (sum(R_all)/100).real
-        return R_avg
+        return self._find_spectral_response().average_reflectance()
 
     def _find_transmittance(self):
         """Calculates transmittance of MultilayerSail, averaged over wavelength.
@@ -252,111 +845,459 @@ class MultilayerSail(Sail):
         float
             Transmittance of MultilayerSail
         """
+        return self._find_spectral_response().average_transmittance()
+
+    def _find_reflectance_gradient(self):
+        """Calculates reflectance of MultilayerSail, averaged over wavelength, and
+        its derivative with respect to the thickness of each layer (adjoint TMM).
+        Parameters
+        ----------
+        None required
+        Returns
+        -------
+        float
+            Reflectance of MultilayerSail
+        array of floats
+            Derivative of reflectance with respect to each thickness [m^-1]
+        """
         #Get parameters
         wavelength = self.wavelength
         target = self.target
-        structure = self._find_structure()
         shift = np.sqrt((1+target)/(1-target))
         bandwidth = np.linspace(wavelength, wavelength*shift, 100)
-        T_all = []
-        for b in bandwidth:
-            _, t_p, _, t_s = tmm(structure, b, 0)
-            T_all.append( ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2) )
-        T_avg = (sum(T_all)/100).real
-        return T_avg
+        (r_p, _, r_s, _), gradients = tmm_gradient(self._find_structure(), bandwidth, 0)
+        R = ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real
+        # Structure uses negative thicknesses, hence the minus sign
+        dR = -_reflectance_derivative(r_p, r_s, gradients['d'][:,0], gradients['d'][:,2])
+        dR = self._fold_gradient(dR)
+        return np.mean(R), np.mean(dR, axis=-1)
+
+    def _find_absorptance_gradient(self, wavelength = None):
+        """Calculates absorptance of MultilayerSail (see _find_absorptance) and its
+        derivative with respect to the thickness of each layer (adjoint TMM).
+        Parameters
+        ----------
+        float or array of floats (optional)
+            wavelength [m]
+        Returns
+        -------
+        float or array of floats
+            Absorptance of MultilayerSail
+        array of floats
+            Derivative of absorptance with respect to each thickness [m^-1],
+            with shape (layers, ...)
+        """
+        if wavelength is None:
+            wavelength = self.wavelength
+        (r_p, t_p, r_s, t_s), gradients = tmm_gradient(self._find_structure_near_IR(wavelength), wavelength, 0)
+        A = 1 - ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real - ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2).real
+        dA = self._fold_gradient(_emissivity_derivative(r_p, t_p, r_s, t_s, gradients['d']))
+        return A, dA
 
-    def _spectral_power_flux(self, wavelength, temperature, points_in_integration = 50):
+    def _find_W_gradient(self):
+        """Calculates W (see _find_W) for the current thicknesses, and its
+        derivative with respect to the thickness of each layer. Assumes the
+        reflectance is the effective reflectance, as for MultilayerSail.
+        Parameters
+        ----------
+        None required
+        Returns
+        -------
+        float
+            Square root of RAAD, W. [sqrt(g)/m]
+        array of floats
+            Derivative of W with respect to each thickness [sqrt(g)/m^2]
+        """
+        R, dR = self._find_reflectance_gradient()
+        s_density = self._find_SA_density() * 1000 #g/m^2
+        ds_density = np.array([material.get_density() for material in self._material_objects()])*self._layer_copies() * 1000 #g/m^3
+        W = _W_per_root_density(self.target)*np.sqrt(s_density)/R
+        dW = W*(ds_density/(2*s_density) - dR/R)
+        return W, dW
+
+    def _find_power_emitted_gradient(self, T):
+        """Calculates the power emitted per unit area at temperature T and its
+        derivative with respect to the thickness of each layer. The quadrature
+        of _find_power_emitted at T is used (see _emission_quadrature), so the
+        power matches it. Directional emissivity derivatives of both faces
+        come from one adjoint TMM pass.
+        Parameters
+        ----------
+        float
+            T(emperature) [K]
+        Returns
+        -------
+        float
+            power_emitted []
+        array of floats
+            Derivative of power_emitted with respect to each thickness [m^-1]
+        """
+        points, quadrature_weights = self._emission_quadrature(T)
+        angles, weights = _angular_quadrature(self.angular_quadrature, self.angular_points)
+        wavelength = points[:, None]
+        emissivity = 0
+        demissivity = 0
+        for (r_p, t_p, r_s, t_s), gradients in tmm_gradient(self._find_structure(wavelength), wavelength, angles, both_sides=True):
+            R = ((r_p*np.conj(r_p) + r_s*np.conj(r_s))/2).real
+            T_ = ((t_p*np.conj(t_p) + t_s*np.conj(t_s))/2).real
+            emissivity = emissivity + np.sum((1-R-T_)*weights, axis=-1)
+            demissivity = demissivity + np.sum(_emissivity_derivative(r_p, t_p, r_s, t_s, gradients['d'])*weights, axis=-1)
+        power_emitted = _power_emitted(T, points, quadrature_weights, emissivity)
+        dpower_emitted = self._fold_gradient(_power_emitted(T, points, quadrature_weights, demissivity))
+        return power_emitted, dpower_emitted
+
+    def _spectral_power_flux(self, wavelength, temperature, points_in_integration = None):
 
         """ Finds the spectral power flux of an "ideal" (perfectly flat and smooth)
         sail. This is the energy emitted per unit area at given wavelength.
         Accounts for asymmetric multilayer_sails
         (along the axis of the incident laser light)
 
-        Uses trapezoidal rule to integrate power emitted at all angles to
-        produce the spectral power flux
-
         Parameters
         ----------
         float
             wavelength [m]
         float
             temperature [m]
-        int
+        int (optional)
             points_in_integration
-                - this is the number of points used in the trapezoidal rule
-                  integration
+                - this is the number of angles used in the integration over
+                  the hemisphere. Defaults to self.angular_points
         Returns
         -------
         float
             emissivity in direction described by angle and sail structure
         """
+        front_emissivity, back_emissivity = self._hemispherical_emissivity(wavelength, points_in_integration)
+        power_flux = pi*_planck(wavelength, temperature)*(front_emissivity + back_emissivity)
+        return power_flux
 
-        def _directional_emissivity(sail, angle, wavelength, front_or_back):
-            """ Calculates the directional emissivity of a given multilayer_sail
-                structure based on a wavelength (float) and incident angle (i.e.
-                angle of elevation). This assumes the sail is perfectly smooth and
-                the structure is radially symmetric along the surface of the sail at
-                each point of the sail.
+    def _hemispherical_emissivity(self, wavelength, points_in_integration = None, quadrature = None, error = False):
+        """ Finds the spectral hemispherical emissivity of the front and back
+        faces of the sail at a given wavelength. Does not depend on temperature.
+
+        Integrates the directional emissivity over all angles using the
+        quadrature rule (see _angular_quadrature).
+
+        Parameters
+        ----------
+        float or array of floats
+            wavelength [m]
+        int (optional)
+            points_in_integration
+                - this is the number of angles used in the integration.
+                  Defaults to self.angular_points
+        str (optional)
+            quadrature
+                - 'gauss' or 'trapz'. Defaults to self.angular_quadrature
+        bool (optional)
+            error
+                - if True, also returns an error estimate for each face: the
+                  difference from the same rule with twice as many angles
+        Returns
+        -------
+        tuple of two floats (or arrays of floats, if wavelength is an array)
+            (front hemispherical emissivity, back hemispherical emissivity)
+            If error is True, (front, back, front error, back error)
+        """
+
+        def _directional_emissivity(sail, angle, wavelength):
+            """ Calculates the directional emissivity of the front and back
+                faces of a given multilayer_sail structure based on a wavelength
+                and incident angle (i.e. angle of elevation). This assumes the
+                sail is perfectly smooth and the structure is radially symmetric
+                along the surface of the sail at each point of the sail.
+                Both faces come from one TMM product (see tmm_both_sides).
                 Parameters
                 ----------
-                float
+                float or array of floats
                     angle [radians]
-                float
-                    wavelength [m]
-                string
-                    front_or_back
-                        - denotes whether we are calculating the directional
-                          emissivity of the front or back face of the sail
+                float or array of floats
+                    wavelength [m], broadcastable against angle
                 Returns
                 -------
-                float
-                    emissivity in direction described by angle and sail structure
+                tuple of two floats or arrays of floats
+                    emissivity of front and back faces in direction described
+                    by angle and sail structure
             """
             # Creates a new structure list that is based on calculated optical constants using wavelength
-            if front_or_back == 'front':
-                structure = self._find_structure(wavelength)
-            elif front_or_back == 'back':
-                structure = self._find_structure(wavelength)
-                structure.reverse()
+            structure = sail._find_structure(wavelength)
 
             # This block gives an expression for emissivity in terms of theta (and wavelength)
             # First set out by finding the reflectance and transmittance of structure at
-            # this wavelength and angle
-            r_p, t_p, r_s, t_s = tmm(structure, wavelength, theta)
-            R = ( r_p*np.conj(r_p) + r_s*np.conj(r_s) )/2
-            T = ( t_p*np.conj(t_p) + t_s*np.conj(t_s) )/2
-            dEpsilon = (1-R-T)
-            return dEpsilon.real
-
-        # First, give expression for radiation emitted by a black body
-        h = 6.62607004e-34       # Planck's constant in SI
-        c = 299792458             # speed of light in SI
-        k_B = 1.38064852e-23        # Boltzmann constant in SI
-        I = ((2*h*c**2)/wavelength**5)*(1/(np.exp(h*c/(wavelength*k_B*temperature))-1))         # Planck's Law
+            # this wavelength and all angles at once, for light incident on either face
+            emissivities = []
+            for r_p, t_p, r_s, t_s in tmm_both_sides(structure, wavelength, angle):
+                R = ( r_p*np.conj(r_p) + r_s*np.conj(r_s) )/2
+                T = ( t_p*np.conj(t_p) + t_s*np.conj(t_s) )/2
+                dEpsilon = (1-R-T)
+                emissivities.append(dEpsilon.real)
+            return tuple(emissivities)
+
+        if points_in_integration is None:
+            points_in_integration = self.angular_points
+        if quadrature is None:
+            quadrature = self.angular_quadrature
 
         # Now give expression for hemispherical emissivity. Note factor of 2: 2 comes
         # from integrating wrt phi (the azimuth)
-        bounds = np.linspace(0,pi/2,points_in_integration)
-
-        # Use trapezoidal integration to speed things up
-        direc_ems = points_in_integration*[None]
-        i = 0
-        for theta in bounds:
-            direc_ems[i] = (2*_directional_emissivity(self, theta, wavelength, 'front')*cos(theta)*sin(theta))
-            i += 1
-        # In the below line, note that the integration returns the spectral hemispherical emissivity
-        front_power_flux = pi*I*np.trapz(direc_ems, bounds, pi/2/points_in_integration)
-
-        # SECOND TIME FOR BACK FACE
-        direc_ems = points_in_integration   *[None]
-        i = 0
-        for theta in bounds:
-            direc_ems[i] = (2*_directional_emissivity(self, theta, wavelength, 'back')*cos(theta)*sin(theta))
-            i += 1
-        back_power_flux = pi*I*np.trapz(direc_ems, bounds, pi/2/points_in_integration)
-
-        power_flux = front_power_flux + back_power_flux
-        return power_flux
+        angles, weights = _angular_quadrature(quadrature, points_in_integration)
+        # Angles run along the last axis, so every wavelength is done at once
+        wavelength = np.asarray(wavelength, dtype=float)[..., None]
+
+        front_direc_ems, back_direc_ems = _directional_emissivity(self, angles, wavelength)
+        front_emissivity = np.sum(front_direc_ems*weights, axis=-1)
+        back_emissivity = np.sum(back_direc_ems*weights, axis=-1)
+
+        if error:
+            front_fine, back_fine = self._hemispherical_emissivity(wavelength[..., 0], 2*points_in_integration, quadrature)
+            return front_emissivity, back_emissivity, abs(front_fine - front_emissivity), abs(back_fine - back_emissivity)
+        return front_emissivity, back_emissivity
+
+    def _emissivity_spectrum(self, points_in_integration = 100, integration_range = [1e-6, 25e-6]):
+        """ Finds the front and back hemispherical spectral emissivity of the
+        sail over a wavelength range. Emissivity is independent of temperature,
+        so the spectrum is calculated once per structure and cached on the sail;
+        changing the materials or thicknesses recalculates it.
+
+        Parameters
+        ----------
+        int (optional)
+            points_in_integration
+                - number of wavelengths in the spectrum
+        list/tuple (optional)
+            integration_range
+                - wavelength range [m] of the spectrum
+        Returns
+        -------
+        array of floats
+            wavelengths [m]
+        array of floats
+            front hemispherical emissivity at each wavelength
+        array of floats
+            back hemispherical emissivity at each wavelength
+        """
+        key = (tuple(self.materials), self._material_versions, tuple(self.thickness), self.period, points_in_integration,
+                tuple(integration_range), self.angular_points, self.angular_quadrature)
+        cache = getattr(self, '_emissivity_cache', None)
+        if cache is None or cache[0] != key:
+            lower_bound, upper_bound = integration_range
+            points = np.linspace(lower_bound, upper_bound, points_in_integration)
+            front_emissivity, back_emissivity = self._hemispherical_emissivity(points)
+            cache = (key, (points, front_emissivity, back_emissivity))
+            self._emissivity_cache = cache
+        return cache[1]
+
+    def _find_absorbed_power_per_watt(self):
+        """ Determines the maximum power absorbed per unit sail area throughout
+            the journey, per watt of laser power. Absorbed power is linear in
+            laser power, so multiplying by self.power gives the absorbed power.
+            Parameters
+            ----------
+            None required
+            Returns
+            -------
+            float
+                maximum absorbed power per unit area per watt of laser power [m^-2]
+        """
+        target = self.target
+
+        # Below block of code finds the maximum power absorbed by the sail throughout its journey
+        betas = np.linspace(0,target,100)  # fraction of speed of light sail is travelling at
+        s_density = self.s_density         # surface area density
+        A = self._find_spectral_response().absorptance_at(betas)
+
+        # Finding the LHS of Atwater et al. 2018's  equation, per watt of laser power
+        power_beta = A*s_density*(1-betas)/(1+betas)/self.mass       # power absorbed when v/c = beta
+
+        # Maximum power in results in highest equilibrium temperature
+        power_absorbed = max(np.max(power_beta), 0)
+        return power_absorbed
+
+    def _emissivity_at(self, wavelengths):
+        """ Finds the front and back hemispherical emissivity at each of a set of
+        wavelengths. Emissivities are memoised per structure, so only wavelengths
+        not seen before are calculated (in one batch).
+
+        Parameters
+        ----------
+        array of floats
+            wavelengths [m]
+        Returns
+        -------
+        array of floats
+            front hemispherical emissivity at each wavelength
+        array of floats
+            back hemispherical emissivity at each wavelength
+        """
+        key = (tuple(self.materials), self._material_versions, tuple(self.thickness), self.period, self.angular_points,
+                self.angular_quadrature)
+        memo = getattr(self, '_emissivity_memo', None)
+        if memo is None or memo[0] != key:
+            memo = (key, {})
+            self._emissivity_memo = memo
+        emissivities = memo[1]
+        new = [wl for wl in dict.fromkeys(wavelengths.tolist()) if wl not in emissivities]
+        if new:
+            front_emissivity, back_emissivity = self._hemispherical_emissivity(np.array(new))
+            emissivities.update(zip(new, zip(front_emissivity.tolist(), back_emissivity.tolist())))
+        front_back = np.array([emissivities[wl] for wl in wavelengths.tolist()]).reshape(-1, 2)
+        return front_back[:,0], front_back[:,1]
+
+    def _find_power_emitted(self, T, points_in_integration = None, integration_range = None, return_evaluations = False):
+        """ Finds the power emitted by a sail with given structure at a
+            specific temperature, by integrating the spectral power flux over
+            the wavelength range self.emission_range (default 1-25 micron).
+
+            By default, uses adaptive Simpson integration: intervals where the
+            Planck spectrum times emissivity is large are refined until the
+            relative error estimate is below self.emission_rtol. Emissivity is
+            temperature-independent and memoised per wavelength, so later
+            temperatures mostly reuse earlier evaluations.
+
+            If points_in_integration is given, a trapezoidal integration over
+            that many evenly spaced wavelengths is used instead.
+            Parameters
+            ----------
+            float
+                T(emperature) [K]
+            int (optional)
+                points_in_integration
+                    - number of points used in trapezoidal integration
+            list/tuple (optional)
+                integration_range
+                    - wavelength range over which spectral power flux
+                      is integrated over to determine total power per
+                      unit area of sail emitted (note the area of the
+                      sail in this respect is the area of one face,
+                      NOT the surface area = 2 * sail area).
+                      Defaults to self.emission_range
+            bool (optional)
+                return_evaluations
+                    - if True, also return the number of spectral evaluations
+                      used
+            Returns
+            ----------
+            float
+                power_emitted []
+            int
+                number of spectral evaluations (if return_evaluations is True)
+        """
+        if integration_range is None:
+            integration_range = self.emission_range
+        if points_in_integration is not None:
+            # The emissivity spectrum is cached, so only the Planck weighting
+            # is recalculated for each temperature
+            points, front_emissivity, back_emissivity = self._emissivity_spectrum(points_in_integration, integration_range)
+            power_out_at_wl = pi*_planck(points, T)*(front_emissivity + back_emissivity)
+            power_emitted = np.trapz(power_out_at_wl, points)
+            evaluations = points_in_integration
+        else:
+            power_emitted, evaluations = self._adaptive_power_emitted(T, integration_range, self.emission_rtol)
+        if return_evaluations:
+            return power_emitted, evaluations
+        return power_emitted
+
+    def _adaptive_power_emitted(self, T, integration_range, rtol, initial_intervals = 8, max_depth = 20,
+                                max_evaluations = 2**14, return_quadrature = False):
+        """ Adaptive Simpson integration of the spectral power flux at temperature
+            T over integration_range. All intervals that need refining are
+            refined together, so the emissivity at the new wavelengths is
+            calculated in one batch per level.
+
+            T may also be an array of temperatures, in which case an interval
+            is only accepted once it is accurate at every temperature, so that
+            the wavelengths used serve all of them.
+
+            Raises a ValueError if the flux is not finite (e.g. a material has
+            n = 0 in the emission range). If refining further would take more
+            than max_evaluations spectral evaluations, warns and returns the
+            estimate so far.
+            Returns
+            ----------
+            float (or array of floats, if T is)
+                power_emitted []
+            int
+                number of spectral evaluations used
+            tuple of two arrays of floats (if return_quadrature is True)
+                wavelengths [m] and weights [m] of the quadrature that was
+                used: power emitted = sum(weights*spectral power flux at the
+                wavelengths)
+        """
+        temperatures = np.atleast_1d(np.asarray(T, dtype=float))[:, None]
+        def flux(wavelengths):
+            front_emissivity, back_emissivity = self._emissivity_at(wavelengths)
+            return pi*_planck(wavelengths, temperatures)*(front_emissivity + back_emissivity)
+
+        lower_bound, upper_bound = integration_range
+        length = upper_bound - lower_bound
+        edges = np.linspace(lower_bound, upper_bound, initial_intervals + 1)
+        a, b = edges[:-1], edges[1:]
+        m = (a + b)/2
+        f = flux(np.concatenate((a, m, b)))
+        fa, fm, fb = np.split(f, 3, axis=-1)
+        evaluations = 2*initial_intervals + 1
+        power_emitted = 0
+        accepted = [] # (a, b) of accepted intervals
+        for depth in range(max_depth):
+            h = b - a
+            lm, rm = (a + m)/2, (m + b)/2
+            flm, frm = np.split(flux(np.concatenate((lm, rm))), 2, axis=-1)
+            evaluations += 2*a.size
+            coarse = h/6*(fa + 4*fm + fb)
+            fine = h/12*(fa + 4*flm + 2*fm + 4*frm + fb)
+            if not np.all(np.isfinite(fine)):
+                raise ValueError(f'Spectral power flux at T = {T} K is not finite. Check the optical '
+                                 'constants of the materials over the emission range.')
+            error = abs(fine - coarse)/15
+            # Each interval may use its share (by width) of the total tolerance
+            estimate = power_emitted + np.sum(fine, axis=-1)
+            accept = np.all(error <= rtol*abs(estimate)[:, None]*h/length, axis=0)
+            # Refining an interval takes 4 evaluations (2 in each half)
+            if evaluations + 4*np.sum(~accept) > max_evaluations:
+                warnings.warn(f'Power emitted at T = {T} K did not converge to rtol = {rtol} within '
+                              f'{max_evaluations} evaluations; returning the estimate so far.')
+                accept[:] = True
+            if depth == max_depth - 1:
+                accept[:] = True
+            power_emitted += np.sum(fine[:, accept] + (fine[:, accept] - coarse[:, accept])/15, axis=-1)
+            accepted.append((a[accept], b[accept]))
+            refine = ~accept
+            if not refine.any():
+                break
+            # Split each refined interval into its two halves
+            a, m, b = (np.concatenate((a[refine], m[refine])), np.concatenate((lm[refine], rm[refine])),
+                        np.concatenate((m[refine], b[refine])))
+            fa, fm, fb = (np.concatenate((fa[:, refine], fm[:, refine]), axis=-1),
+                        np.concatenate((flm[:, refine], frm[:, refine]), axis=-1),
+                        np.concatenate((fm[:, refine], fb[:, refine]), axis=-1))
+        if np.ndim(T) == 0:
+            power_emitted = power_emitted[0]
+        if not return_quadrature:
+            return power_emitted, evaluations
+        # Simpson's rule on both halves with the Richardson correction is
+        # Boole's rule on the five points of each interval
+        a = np.concatenate([interval[0] for interval in accepted])
+        b = np.concatenate([interval[1] for interval in accepted])
+        h = b - a
+        m = (a + b)/2
+        points = np.concatenate((a, (a + m)/2, m, (m + b)/2, b))
+        weights = np.concatenate([w*h/180 for w in (14, 64, 24, 64, 14)])
+        # Neighbouring intervals share their end points
+        wavelengths, index = np.unique(points, return_inverse=True)
+        return power_emitted, evaluations, (wavelengths, np.bincount(index, weights))
+
+    def _emission_quadrature(self, temperatures):
+        """ Wavelengths [m] and weights [m] of a quadrature of the power
+            emitted over self.emission_range, chosen by the adaptive integration
+            of _find_power_emitted so that it is accurate to emission_rtol at
+            each of temperatures [K]. Sails with the emissivity of this sail at
+            the wavelengths (or close to it, e.g. variants of it) then emit
+            _power_emitted(T, wavelengths, weights, emissivity).
+        """
+        _, _, quadrature = self._adaptive_power_emitted(np.asarray(temperatures, dtype=float), self.emission_range,
+                                                        self.emission_rtol, return_quadrature=True)
+        return quadrature
 
     def _find_eq_temps_given_abs_coeff(self):
         """ Determines the maximum equilibrium temperature of the sail given
@@ -371,26 +1312,143 @@ class MultilayerSail(Sail):
             float
                 equilibrium temperature [K]
         """
-        initial_wavelength = self.wavelength        # laser wavelength
-        target = self.target
+        power_absorbed = self.power*self._find_absorbed_power_per_watt()
+        return self._temp_at_power_emitted(power_absorbed)
 
-        # Below block of code finds the maximum power absorbed by the sail throughout its journey
-        betas = np.linspace(0,target,100)  # fraction of speed of light sail is travelling at
-        power_absorbed = 0       # need to find maximum p_in based on beta
-        power_mass_ratio = self.power/self.mass     # laser power to mass ratio of sail
-        s_density = self.s_density         # surface area density
+    def equilibrium_temp(self, power = None, beta = None):
+        """ Equilibrium temperature of the sail at a laser power. Solved for
+            directly, or looked up on the emitted power curve once repeated
+            queries have built it (see _power_emitted_curve).
+            Parameters
+            ----------
+            float (optional)
+                power
+                    - laser power [W]. Defaults to self.power
+            float (optional)
+                beta
+                    - speed (v/c) at which the temperature is found. Defaults
+                      to the hottest point of the journey, as temp_reached
+            Returns
+            -------
+            float
+                equilibrium temperature [K]
+        """
+        if power is None:
+            power = self.power
+        if beta is None:
+            power_per_watt = self._find_absorbed_power_per_watt()
+        else:
+            A = self._find_spectral_response().absorptance_at(beta)
+            power_per_watt = max(A*self.s_density*(1-beta)/(1+beta)/self.mass, 0)
+        return self._temp_at_power_emitted(power*power_per_watt)
+
+    def max_power_at(self, max_temp = None):
+        """ Highest laser power [W] at which the equilibrium temperature stays
+            within max_temp [K] for the whole journey (defaults to the max
+            temperature of the materials and Starchip), from the power
+            emitted at max_temp (integrated, or looked up on the emitted power
+            curve once built; see _power_emitted_curve).
+        """
+        if max_temp is None:
+            max_temp = self._find_max_temp()
+        return self._power_emitted_at(max_temp)/self._find_absorbed_power_per_watt()
+
+    def _power_emitted_curve(self, initial_points = 17, max_refinements = 10, min_step = 0.01):
+        """ Monotone interpolant of the power emitted per unit area against
+            temperature, and its inverse. Emitted power depends only on the
+            structure (not on laser power, speed or temperature limits), so
+            once the curve is built, thermal questions become lookups.
 
-        # Loop that gets the maximum power value
-        for beta in betas:
-            wavelength = initial_wavelength*np.sqrt((1+beta)/(1-beta))
-            A = self._find_absorptance(wavelength)
+            Building the curve costs a few direct solves, so it is only built
+            on the _CURVE_QUERIES-th thermal query on the same structure
+            (e.g. equilibrium_temp at several powers); until then, None is
+            returned and the caller integrates or solves directly. The curve
+            is kept on the sail until the structure changes.
 
-            # Finding the LHS of Atwater et al. 2018's  equation
-            power_beta = power_mass_ratio*A*s_density*(1-beta)/(1+beta)       # power absorbed when v/c = beta
+            log(power emitted) is interpolated against log(T) with PCHIP, which
+            preserves the monotonicity of the data, so the curve can be
+            inverted. Temperatures from 50 K to twice the highest (finite) max
+            temperature of the materials and Starchip are covered. Intervals
+            are halved until the curve is within 2*emission_rtol of
+            _find_power_emitted at their midpoints (each value is only
+            accurate to emission_rtol, so a smaller difference is noise), or
+            until they are narrower than min_step in log(T): the integration
+            error changes in jumps as its wavelengths change with T, and a
+            jump cannot be resolved by refining.
+            Returns
+            -------
+            PchipInterpolator
+                log(power emitted) as a function of log(T)
+            PchipInterpolator
+                log(T) as a function of log(power emitted)
+            tuple of two floats
+                range of temperatures covered [K]
+            Or None if the curve has not been built, if the emitted power at
+            the nodes is not increasing, or if the refinement did not
+            converge within max_refinements (the temperature then has to be
+            solved for directly).
+        """
+        max_temps = [mat.get_max_temp() for mat in self._material_objects()] + [self.max_Starchip_temp]
+        T_range = (50, 2*max(T for T in max_temps if np.isfinite(T)))
+        key = (tuple(self.materials), self._material_versions, tuple(self.thickness), self.period, self.angular_points,
+                self.angular_quadrature, tuple(self.emission_range), self.emission_rtol, T_range)
+        cache = getattr(self, '_power_emitted_cache', None)
+        if cache is None or cache[0] != key:
+            cache = (key, 0, None)
+        key, queries, curve = cache
+        queries += 1
+        if queries == self._CURVE_QUERIES:
+            tol = 2*self.emission_rtol
+            log_T = np.linspace(np.log(T_range[0]), np.log(T_range[1]), initial_points)
+            log_P = np.log([self._find_power_emitted(np.exp(t)) for t in log_T])
+            check = np.arange(initial_points - 1) # Intervals whose midpoints are checked
+            monotone = np.all(np.diff(log_P) > 0)
+            for _ in range(max_refinements):
+                if not monotone or check.size == 0:
+                    break
+                mid = (log_T[check] + log_T[check+1])/2
+                log_P_mid = np.log([self._find_power_emitted(np.exp(t)) for t in mid])
+                refine = np.abs(PchipInterpolator(log_T, log_P)(mid) - log_P_mid) > tol
+                refine &= log_T[check+1] - log_T[check] >= 2*min_step
+                # Every midpoint is exact, so all are added; the halves of the
+                # intervals that failed are checked again
+                log_T, log_P = np.concatenate((log_T, mid)), np.concatenate((log_P, log_P_mid))
+                order = np.argsort(log_T)
+                log_T, log_P = log_T[order], log_P[order]
+                monotone = np.all(np.diff(log_P) > 0)
+                position = np.searchsorted(log_T, mid[refine])
+                check = np.sort(np.concatenate((position - 1, position)))
+            # Both directions are interpolated through the same (checked) nodes,
+            # so that they invert each other
+            if monotone and check.size == 0:
+                curve = (PchipInterpolator(log_T, log_P), PchipInterpolator(log_P, log_T), T_range)
+        self._power_emitted_cache = (key, queries, curve)
+        return curve
+
+    def _power_emitted_at(self, T):
+        """ Power emitted per unit area at temperature T, from the emitted
+            power curve if T is within it, otherwise by integration. """
+        curve = self._power_emitted_curve()
+        if curve is not None and curve[2][0] <= T <= curve[2][1]:
+            return float(np.exp(curve[0](np.log(T))))
+        return self._find_power_emitted(T)
 
-            if power_beta > power_absorbed:
-                power_absorbed = power_beta     # since maximum power in results in highest equilibrium temperature
+    def _temp_at_power_emitted(self, power_emitted):
+        """ Temperature at which the sail emits power_emitted per unit area,
+            i.e. the equilibrium temperature when it absorbs power_emitted.
+            Looked up on the emitted power curve if it is within it, otherwise
+            solved for (see _solve_eq_temp). """
+        curve = self._power_emitted_curve()
+        if curve is not None and power_emitted > 0:
+            log_P = np.log(power_emitted)
+            if curve[1].x[0] <= log_P <= curve[1].x[-1]:
+                return float(np.exp(curve[1](log_P)))
+        return self._solve_eq_temp(power_emitted)
 
+    def _solve_eq_temp(self, power_absorbed):
+        """ Solves for the equilibrium temperature [K] at which the power
+            emitted per unit area equals power_absorbed, with Brent's method.
+        """
         def power_in_minus_out(T, power_absorbed):
             """ Uses an input temperature to find the total power emitted by the
                 sail per unit sail area. Subtracts this value from the power absorbed, given as input.
@@ -408,40 +1466,7 @@ class MultilayerSail(Sail):
                     difference []
                         - difference between power_absorbed and power_emitted
             """
-
-            def find_power_emitted(T, points_in_integration = 100, integration_range = [1e-6, 25e-6]):
-                """ Finds the power emitted by a sail with given structure at a
-                    specific temperature. Determnied by performing a trapezoidal
-                    integration over a (default 1-25 micron) wavelength range of the
-                    spectral power flux, calculated by the _spectral_power_flux()
-                    method.
-                    Parameters
-                    ----------
-                    float
-                        T(emperature) [K]
-                    int (optional)
-                        points_in_integration
-                            - number of points used in trapezoidal integration
-                    list/tuple (optional)
-                        integration_range
-                            - wavelength range over which spectral power flux
-                              is integrated over to determine total power per
-                              unit area of sail emitted (note the area of the
-                              sail in this respect is the area of one face,
-                              NOT the surface area = 2 * sail area)
-                    Returns
-                    ----------
-                    float
-                        power_emitted []
-                """
-                lower_bound, upper_bound = integration_range
-                points = np.linspace(lower_bound, upper_bound, points_in_integration)
-                # Calling _spectral_power_flux at each point and adding to the list for integration
-                power_out_at_wl = [self._spectral_power_flux(wavelength,T) for wavelength in points]
-                power_emitted = np.trapz(power_out_at_wl, points, (upper_bound - lower_bound)/points_in_integration)
-                return power_emitted
-
-            return power_absorbed - find_power_emitted(T)
+            return power_absorbed - self._find_power_emitted(T)
 
         # The zero of the _power_in_minus_out function occurs when the sail is at
         # equilibrium temperature. Hence, we can use Newton's method to estimate
@@ -471,18 +1496,68 @@ class MultilayerSail(Sail):
 
         return eq_temp
 
-    def _find_max_power(self):
-        """Find the highest power the MultilayerSail can be subject to."""
-        max_temp = min([mat.get_max_temp() for mat in self._material_objects()] + [self.max_Starchip_temp]) #max temp the sail can endure
-        print('Finding max power...')
-        print(f'Maximum temp the sail can be subject to = {max_temp} K')
+    def _find_max_temp(self):
+        """Find the maximum temperature the sail can endure [K]."""
+        return min([mat.get_max_temp() for mat in self._material_objects()] + [self.max_Starchip_temp])
+
+    def _find_max_power(self, tol=1e-2, method='direct'):
+        """Find the highest power the MultilayerSail can be subject to.
+
+        Parameters
+        ----------
+        float (optional)
+            tol
+                - relative tolerance on the max power. The direct method is
+                  checked against it; the iterative method converges to it.
+        str (optional)
+            method
+                - 'direct' inverts the thermal balance: absorbed power is linear
+                  in laser power, so max power = power emitted at the max
+                  temperature / max absorbed power per watt. If the power
+                  emitted was looked up on the emitted power curve, the result
+                  is checked against the power emitted found by integration.
+                - 'iterative' solves for the power at which the equilibrium
+                  temperature equals the max temperature using Newton's method.
+                  Used as a fallback if the direct method fails.
+        Returns
+        -------
+        float
+            Maximum laser power [W]
+        """
+        max_temp = self._find_max_temp() #max temp the sail can endure
+        verbose = self._verbose
+        if verbose:
+            print('Finding max power...')
+            print(f'Maximum temp the sail can be subject to = {max_temp} K')
+        if self._find_absorbed_power_per_watt() <= 0:
+            raise ValueError('Sail absorbs no laser power, so its max power is unbounded. '
+                             'Check the absorption coefficients of its materials.')
+        if method == 'direct':
+            max_power = self.max_power_at(max_temp)
+            if np.isfinite(max_power) and max_power > 0:
+                #Check against the power emitted at the max temp found by
+                #integration, independently of the emitted power curve
+                check = self._find_power_emitted(max_temp)/self._find_absorbed_power_per_watt()
+                if verbose:
+                    print(f'Max power = {max_power * 1e-9:.2f} GW (integrated: {check * 1e-9:.2f} GW)')
+                if abs(max_power - check) <= tol*check:
+                    return max_power
+            if verbose:
+                print('Direct method failed, using iterative method...')
+        elif method != 'iterative':
+            raise ValueError("method must be 'direct' or 'iterative'")
         copied_sail = deepcopy(self) #To protect from changing variables accidentally
         #Define function to solve.
         def f(P, multisail, max_temp):
             multisail.power = P
             temp = multisail._find_eq_temps_given_abs_coeff()
-            print(f'At power = {P * 1e-9:.2f} GW, equilibrium temperature = {temp:.2f} K')
+            if verbose:
+                print(f'At power = {P * 1e-9:.2f} GW, equilibrium temperature = {temp:.2f} K')
             return temp - max_temp
 
-        max_power = scipy.optimize.newton(f, 100e9, args=(copied_sail, max_temp), tol=1e9)
+        #Start from the direct estimate if there is one. tol is relative to the
+        #max power, as for the direct method; Newton's tolerance is in watts
+        if method != 'direct' or not (np.isfinite(max_power) and max_power > 0):
+            max_power = 100e9
+        max_power = scipy.optimize.newton(f, max_power, args=(copied_sail, max_temp), tol=tol*max_power)
         return max_power
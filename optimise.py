@@ -0,0 +1,258 @@
+from Starshot.multilayer_sail import MultilayerSail
+import numpy as np
+import scipy.optimize
+import scipy.integrate as integrate
+
+def optimise_thickness(name=None, materials=None, thickness=None, mass=None, area=None,
+                       target=0.2, max_Starchip_temp=1000, power=None, wavelength=1.064e-6,
+                       objective='diameter', bounds=(10e-9, 1e-6), n_starts=1, seed=None,
+                       maxiter=100, period=None, surrogate=None, verbose=True):
+    """Optimises the layer thicknesses of a MultilayerSail to minimise the
+    laser array diameter or the acceleration distance, while keeping the
+    equilibrium temperature within the limits of the materials and Starchip.
+
+    Thickness gradients come from the adjoint TMM (see
+    MultilayerSail._find_W_gradient etc.), and each evaluation uses batched
+    spectral calculations, so SLSQP converges in tens of iterations.
+
+    If power is given, the thermal limit is a constraint: the power absorbed
+    at that laser power must not exceed the power emitted at the maximum
+    temperature. If power is None, the laser power is the max power the sail
+    can be subject to (see MultilayerSail._find_max_power), so the thermal
+    limit is built into the objective.
+
+    Parameters
+    ----------
+    name : str
+        A name or code that identifies the optimised sail
+    materials : list of str, or list of lists of str
+        Materials in each layer. If a list of lists is given, each stack
+        (which may have a different number of layers) is optimised and the
+        best is returned.
+    thickness : list of floats (optional)
+        Initial thickness of each layer [m]. If None, or if several stacks
+        are given, starts are drawn randomly within bounds.
+    mass : float
+        Mass of lightsail (excluding payload) [kg]. Either mass or area is
+        kept fixed while the thicknesses change.
+    area : float
+        Area of lightsail [m^2]
+    target, max_Starchip_temp, power, wavelength
+        As for MultilayerSail
+    objective : str
+        'diameter' (laser array diameter, see Sail._find_diameter) or
+        'distance' (acceleration distance to target with no diffraction losses)
+    bounds : tuple of two floats
+        Lower and upper bound on each thickness [m]
+    n_starts : int
+        Number of starts for each stack. The first start uses thickness if
+        given; the others are random.
+    seed : int
+        Seed for random starts
+    maxiter : int
+        Maximum iterations of each start
+    period : tuple of three ints
+        As for MultilayerSail. The thicknesses of the unit cell are the same
+        in every repeat.
+    surrogate : Surrogate
+        If given, stacks that it covers (same materials, period, wavelength,
+        target and max_Starchip_temp) are optimised on the surrogate (see surrogate.py) within
+        its bounds, with finite-difference gradients, instead of with TMM.
+        The returned sail is calculated exactly.
+    verbose : bool
+        Print progress
+
+    Returns
+    -------
+    MultilayerSail
+        Optimised sail
+    list of dicts
+        Convergence history. One entry per iteration, with keys 'start',
+        'materials', 'thickness' and 'objective' (in the units of the
+        objective: m).
+    """
+    if name is None:
+        raise ValueError("Enter name")
+    if materials is None:
+        raise ValueError("Enter material(s)")
+    if mass is None and area is None:
+        raise ValueError("Enter mass or area")
+    if objective not in ('diameter', 'distance'):
+        raise ValueError("objective must be 'diameter' or 'distance'")
+    stacks = [materials] if isinstance(materials[0], str) else materials
+    rng = np.random.default_rng(seed)
+    history = []
+    best = None
+    for stack in stacks:
+        stack_bounds = np.array([bounds]*len(stack), dtype=float)
+        use_surrogate = surrogate is not None and surrogate.matches({'materials': list(stack),
+            'thickness': surrogate.bounds.mean(axis=1), 'period': period, 'wavelength': wavelength, 'target': target,
+            'max_Starchip_temp': max_Starchip_temp})
+        if use_surrogate:
+            stack_bounds[:, 0] = np.maximum(stack_bounds[:, 0], surrogate.bounds[:, 0])
+            stack_bounds[:, 1] = np.minimum(stack_bounds[:, 1], surrogate.bounds[:, 1])
+        for start in range(n_starts):
+            if thickness is not None and len(stacks) == 1 and start == 0:
+                x0 = np.clip(np.array(thickness, dtype=float), stack_bounds[:, 0], stack_bounds[:, 1])
+            else:
+                x0 = rng.uniform(stack_bounds[:, 0], stack_bounds[:, 1])
+            if use_surrogate:
+                problem = _SurrogateProblem(surrogate, mass, area, power, objective, max_Starchip_temp, stack_bounds*1e9)
+            else:
+                sail = MultilayerSail(name=name, materials=list(stack), mass=mass, thickness=list(x0),
+                    area=area if mass is None else None, target=target, max_Starchip_temp=max_Starchip_temp,
+                    power=power, wavelength=wavelength, period=period, verbose=False)
+                problem = _ThicknessProblem(sail, mass, area, power, objective)
+            start_index = len({(h['start'], tuple(h['materials'])) for h in history})
+            def callback(x, problem=problem, stack=stack, start_index=start_index):
+                history.append({'start': start_index, 'materials': list(stack),
+                    'thickness': list(x*1e-9), 'objective': np.exp(problem.fun(x)[0])})
+            callback(x0*1e9)
+            result = scipy.optimize.minimize(problem.fun, x0*1e9, jac=True, method='SLSQP',
+                bounds=[tuple(b) for b in stack_bounds*1e9], constraints=problem.constraints(),
+                callback=callback, options={'maxiter': maxiter})
+            value = np.exp(problem.fun(result.x)[0])
+            feasible = all(c['fun'](result.x) >= -1e-6 for c in problem.constraints())
+            if verbose:
+                print(f'{stack}: thickness = {list(result.x*1e-9)}, {objective} = {value:.4g} m, '
+                      f'iterations = {result.nit}, feasible = {feasible}')
+            if feasible and (best is None or value < best[0]):
+                best = (value, list(stack), list(result.x*1e-9))
+    if best is None:
+        raise ValueError('No thicknesses found that satisfy the temperature limits')
+    _, best_materials, best_thickness = best
+    sail = MultilayerSail(name=name, materials=best_materials, mass=mass, thickness=best_thickness,
+        area=area if mass is None else None, target=target, max_Starchip_temp=max_Starchip_temp,
+        power=power, wavelength=wavelength, period=period, verbose=verbose)
+    return sail, history
+
+class _Problem:
+    """Objective and thermal constraint in the form SLSQP takes them, from
+    _evaluate(x) = (f, df, g, dg) of a subclass, which also sets power."""
+    def fun(self, x):
+        f, df, _, _ = self._evaluate(x)
+        return f, df
+
+    def constraints(self):
+        if self.power is None:
+            return []
+        return [{'type': 'ineq', 'fun': lambda x: self._evaluate(x)[2], 'jac': lambda x: self._evaluate(x)[3]}]
+
+class _ThicknessProblem(_Problem):
+    """Objective and thermal constraint for optimise_thickness, as functions of
+    the thicknesses in nm. The objective is the log of the diameter/distance so
+    that its scale does not depend on the stack."""
+    def __init__(self, sail, mass, area, power, objective):
+        self.sail = sail
+        self.mass = mass
+        self.area = area
+        self.power = power
+        self.objective = objective
+        self.max_temp = sail._find_max_temp()
+        self._last = None
+
+    def _update(self, x):
+        """Set sail thickness to x [nm]. Mass (or area) stays fixed; the other
+        follows the surface density."""
+        self.sail.thickness = list(x*1e-9)
+
+    def _evaluate(self, x):
+        """Log of every quantity needed, and its gradient with respect to x [nm]."""
+        if self._last is not None and np.array_equal(self._last[0], x):
+            return self._last[1]
+        self._update(x)
+        sail = self.sail
+        densities = np.array([material.get_density() for material in sail._material_objects()])*sail._layer_copies()
+        #ln(mass) and gradient
+        if self.mass is not None:
+            ln_mass, dln_mass = np.log(sail.mass), np.zeros(len(x))
+        else:
+            ln_mass, dln_mass = np.log(sail.mass), densities/sail.s_density
+        #Maximum absorbed power per watt over the journey, and gradient at the maximum
+        betas = np.linspace(0, sail.target, 100)
+        A, dA = sail._find_absorptance_gradient(sail.wavelength*np.sqrt((1+betas)/(1-betas)))
+        doppler = (1-betas)/(1+betas)
+        i = np.argmax(A*doppler)
+        s_per_mass = sail.s_density/sail.mass
+        ds_per_mass = densities/sail.mass - s_per_mass*dln_mass
+        absorbed = A[i]*doppler[i]*s_per_mass
+        dabsorbed = (dA[:,i]*s_per_mass + A[i]*ds_per_mass)*doppler[i]
+        ln_absorbed, dln_absorbed = np.log(absorbed), dabsorbed/absorbed
+        #Power emitted at the max temperature
+        emitted, demitted = sail._find_power_emitted_gradient(self.max_temp)
+        ln_emitted, dln_emitted = np.log(emitted), demitted/emitted
+        #Laser power
+        if self.power is not None:
+            ln_power, dln_power = np.log(self.power), np.zeros(len(x))
+        else:
+            ln_power, dln_power = ln_emitted - ln_absorbed, dln_emitted - dln_absorbed
+        #Objective
+        c = 2.998e8 #m/s
+        if self.objective == 'diameter':
+            W, dW = sail._find_W_gradient()
+            const = np.log(2*sail.wavelength*c**3/(np.sqrt(np.pi)*1000)*np.sqrt(1000))
+            f = const + ln_mass/2 + np.log(W) - ln_power
+            df = dln_mass/2 + dW/W - dln_power
+        else:
+            R, dR = sail._find_reflectance_gradient()
+            def integrand(beta):
+                gamma = 1/np.sqrt(1-beta**2)
+                return beta*gamma**3*(1+beta)/(1-beta)
+            J, _ = integrate.quad(integrand, 0, sail.target)
+            #Optimal mass condition: total mass is twice the sail mass
+            f = np.log(2*c**3*J/2) + ln_mass - ln_power - np.log(R)
+            df = dln_mass - dln_power - dR/R
+        #Thermal constraint: ln(emitted) - ln(power*absorbed) >= 0
+        g = ln_emitted - ln_power - ln_absorbed
+        dg = dln_emitted - dln_power - dln_absorbed
+        result = (f, df*1e-9, g, dg*1e-9)
+        self._last = (np.array(x), result)
+        return result
+
+class _SurrogateProblem(_Problem):
+    """Objective and thermal constraint for optimise_thickness found from a
+    Surrogate, as functions of the thicknesses in nm. Gradients are central
+    differences, which cost microseconds on the surrogate."""
+    def __init__(self, surrogate, mass, area, power, objective, max_Starchip_temp, bounds, step=1e-3):
+        self.surrogate = surrogate
+        self.mass = mass
+        self.area = area
+        self.power = power
+        self.objective = objective
+        self.max_Starchip_temp = max_Starchip_temp
+        self.bounds = bounds
+        self.step = step
+        self._last = None
+
+    def _values(self, x):
+        """Log of the objective, and the thermal constraint (see _ThicknessProblem._evaluate)."""
+        x = np.clip(x, self.bounds[:, 0], self.bounds[:, 1])
+        results = self.surrogate.evaluate(list(x*1e-9), mass=self.mass, area=self.area if self.mass is None else None,
+                                          max_Starchip_temp=self.max_Starchip_temp)
+        #Without power, results are at the max power
+        max_power = results['power']
+        power = max_power if self.power is None else self.power
+        c = 2.998e8 #m/s
+        if self.objective == 'diameter':
+            f = np.log(results['diameter']*max_power/power)
+        else:
+            def integrand(beta):
+                gamma = 1/np.sqrt(1-beta**2)
+                return beta*gamma**3*(1+beta)/(1-beta)
+            J, _ = integrate.quad(integrand, 0, self.surrogate.metadata['target'])
+            f = np.log(2*c**3*J/2) + np.log(results['mass']) - np.log(power) - np.log(results['reflectance'])
+        return np.array([f, np.log(max_power) - np.log(power)])
+
+    def _evaluate(self, x):
+        if self._last is not None and np.array_equal(self._last[0], x):
+            return self._last[1]
+        values = self._values(x)
+        gradient = np.empty((len(x), 2))
+        for i in range(len(x)):
+            high, low = x.copy(), x.copy()
+            high[i] = min(x[i] + self.step, self.bounds[i, 1])
+            low[i] = max(x[i] - self.step, self.bounds[i, 0])
+            gradient[i] = (self._values(high) - self._values(low))/(high[i] - low[i])
+        result = (values[0], gradient[:, 0], values[1], gradient[:, 1])
+        self._last = (np.array(x), result)
+        return result
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+""" Opt-in, content-addressed on-disk cache of expensive MultilayerSail results
+    (reflectance, transmittance, absorptance, temperature reached and max
+    power), so re-running a script, notebook or sweep does not recalculate them.
+
+    Results are stored as json files in the saved_results directory, named by a
+    hash of the inputs that result depends on (e.g. the reflectance depends on
+    the materials and the versions of their saved data, thicknesses, laser
+    wavelength and target, but not on mass or power; the temperature also
+    depends on mass, area, laser power, Starchip temperature and integration
+    settings), so a sweep of mass or power reuses the optics. Saving a material
+    with different data changes its hash, so results calculated with the old
+    data are never used again (and are eventually evicted). When the total size
+    of the directory exceeds its limit, the least recently used results are
+    evicted.
+
+    The cache is disabled by default. Use enable_result_cache() to turn it on;
+    it is then consulted by every MultilayerSail that is constructed.
+"""
+
+#Increase when the calculations change, so that old results are not used
+CACHE_VERSION = 2
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache of sail results.
+
+    ...
+
+    Attributes
+    ----------
+    directory : Path
+        Directory where results are stored
+    max_bytes : int
+        Size limit of stored results [bytes]
+    nbytes : int
+        Size of stored results [bytes], counted when the cache is created and
+        kept up to date as results are stored
+    hits : int
+        Number of lookups that found a stored result
+    misses : int
+        Number of lookups that did not
+    """
+    def __init__(self, directory='saved_results', max_bytes=16*2**20):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self.nbytes = sum(size for _, size, _ in self._entries())
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(inputs):
+        """Canonical hash of a dict of inputs (json-serialisable values)."""
+        text = json.dumps({'version': CACHE_VERSION, **inputs}, sort_keys=True)
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def _path(self, key):
+        return self.directory.joinpath(key + '.json')
+
+    def get(self, key):
+        """Return stored dict of results for key, or None."""
+        path = self._path(key)
+        try:
+            with path.open() as f:
+                result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(path) #Mark as recently used
+        return result
+
+    def put(self, key, result):
+        """Store dict of results for key. If the size limit is exceeded, least
+        recently used results are evicted down to 90% of it, so that a full
+        cache is not scanned on every write."""
+        path = self._path(key)
+        tmp = path.with_name(f'{key}.{os.getpid()}.tmp')
+        with tmp.open('w') as f:
+            json.dump(result, f)
+        size = tmp.stat().st_size
+        try:
+            size -= path.stat().st_size #Replacing a stored result
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path) #Atomic, so other processes never read part of a file
+        self.nbytes += size
+        if self.nbytes > self.max_bytes:
+            self.evict(0.9*self.max_bytes)
+
+    def _entries(self):
+        """List of (mtime, size, path) of every stored result."""
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def evict(self, max_bytes=None):
+        """Remove least recently used results until their size is within
+        max_bytes (defaults to the size limit). The directory is scanned again,
+        so results stored or removed by other processes are counted."""
+        entries = self._entries()
+        self.nbytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if self.nbytes <= (self.max_bytes if max_bytes is None else max_bytes):
+                break
+            path.unlink(missing_ok=True)
+            self.nbytes -= size
+
+    def clear(self):
+        """Remove all stored results and reset counters."""
+        for path in self.directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Return dict of hits, misses, number of entries, nbytes and max_bytes."""
+        sizes = [path.stat().st_size for path in self.directory.glob('*.json')]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(sizes),
+                'nbytes': sum(sizes), 'max_bytes': self.max_bytes}
+
+_cache = None
+
+def enable_result_cache(directory='saved_results', max_bytes=16*2**20):
+    """Turn on the result cache with a directory and size limit [bytes]. Returns the cache."""
+    global _cache
+    if _cache is None or _cache.directory != Path(directory):
+        _cache = ResultCache(directory, max_bytes)
+    else:
+        _cache.max_bytes = max_bytes
+        if _cache.nbytes > max_bytes:
+            _cache.evict()
+    return _cache
+
+def disable_result_cache():
+    """Turn off the result cache. Stored results are kept on disk."""
+    global _cache
+    _cache = None
+
+def get_result_cache():
+    """Return the result cache, or None if it is disabled."""
+    return _cache
+
+def result_cache_info():
+    """Return hit/miss counters and disk use of the result cache, or None if it is disabled."""
+    if _cache is None:
+        return None
+    return _cache.info()
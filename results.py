@@ -41,7 +41,7 @@ def make_varfile(dir, sail):
     """Make a txt file containing sail variables."""
     var_file = os.path.join(dir, r'variables.txt')
     with open(var_file, 'w') as f:
-        variables = [[key, value] for key, value in sail.__dict__.items()]
+        variables = [[key, value] for key, value in sail._variables()]
         table = tabulate(variables)
         f.write(table)
 
@@ -121,11 +121,15 @@ class Sail:
         None
             Prints variables to output
         """
-        for variable, value in self.__dict__.items():
+        for variable, value in self._variables():
             print(variable, '=', value)
         print('')
 
-    def calculate_mission(self):
+    def _variables(self):
+        """List of (variable, value) of the sail, skipping private (cached) attributes."""
+        return [(variable, value) for variable, value in self.__dict__.items() if not variable.startswith('_')]
+
+    def calculate_mission(self, **options):
         """Calculates the mission scenario, including distance vs speed vs time.
         A folder is created with 2 txt files and 1 png file.
         1 txt file includes distance, speed and time results, the other txt file
@@ -134,7 +138,9 @@ class Sail:
 
         Parameters
         ----------
-        None required
+        options (optional)
+            Keyword arguments passed to motion.state_vs_t, e.g.
+            method='RK45', stop_at_target=True
 
         Returns
         -------
@@ -143,7 +149,7 @@ class Sail:
         """
         if self.power is None:
             raise ValueError("Enter power")
-        state, time = state_vs_t(self)
+        state, time = state_vs_t(self, **options)
         beta, dist = state
         write_results(self, beta, dist, time)
 
@@ -0,0 +1,59 @@
+import numpy as np
+
+class SpectralResponse:
+    """
+    Optical response of a sail over the Doppler-shifted laser band.
+
+    ...
+
+    Attributes
+    ----------
+    wavelengths : array of floats
+        Wavelengths across the band, from the laser wavelength to the laser
+        wavelength Doppler-shifted at the target speed [m]
+    reflectance : array of floats
+        Reflectance at each wavelength
+    transmittance : array of floats
+        Transmittance at each wavelength
+    absorptance : array of floats
+        Absorptance at each wavelength, based on the absorption coefficients
+        of the sail materials
+
+    Methods
+    -------
+    average_reflectance()
+        Reflectance averaged over the band
+    average_transmittance()
+        Transmittance averaged over the band
+    absorptance_at(beta)
+        Absorptance when the sail travels at beta
+    """
+    def __init__(self, wavelengths, reflectance, transmittance, absorptance):
+        """The constructor for SpectralResponse class
+
+        Parameters
+        ----------
+        array of floats
+            wavelengths [m], in ascending order
+        arrays of floats
+            reflectance, transmittance and absorptance at each wavelength
+        """
+        self.wavelengths = wavelengths
+        self.reflectance = reflectance
+        self.transmittance = transmittance
+        self.absorptance = absorptance
+
+    def average_reflectance(self):
+        """Returns reflectance averaged over the band."""
+        return np.mean(self.reflectance)
+
+    def average_transmittance(self):
+        """Returns transmittance averaged over the band."""
+        return np.mean(self.transmittance)
+
+    def absorptance_at(self, beta):
+        """Returns absorptance (float or array of floats) when the sail travels
+        at beta (v/c), interpolated at the Doppler-shifted laser wavelength."""
+        laser_wavelength = self.wavelengths[0]
+        wavelength = laser_wavelength*np.sqrt((1+np.asarray(beta))/(1-np.asarray(beta)))
+        return np.interp(wavelength, self.wavelengths, self.absorptance)
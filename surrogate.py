@@ -0,0 +1,337 @@
+import json
+import numpy as np
+import scipy.optimize
+from numpy import pi
+from numpy.polynomial import chebyshev
+from Starshot.multilayer_sail import MultilayerSail, _power_emitted, _W_per_root_density
+from Starshot.materials.save_load_mat import material_version
+
+""" Surrogate models of the optics of a fixed stack of materials, as functions
+    of the layer thicknesses, for screening studies where even a batched TMM
+    is too slow in the inner loop.
+
+    Each quantity is a tensor-product Chebyshev expansion over the box of
+    thicknesses, interpolating the exact (TMM) values at Chebyshev nodes. The
+    error is then measured against exact calculations at random thicknesses
+    in the box, and recorded with the surrogate. Evaluating a surrogate is a
+    few small tensor contractions, independent of the number of wavelengths
+    and angles in the exact calculation.
+
+    Surrogates are saved as .npz files with the material versions they were
+    fitted to (see save_load_mat.material_version); loading one fitted to
+    materials that have since changed raises an error.
+"""
+
+#Quantities of a surrogate, in the order they are stored
+QUANTITIES = ['reflectance', 'transmittance', 'beta_absorptance', 'emissivity']
+
+def fit_surrogate(materials, bounds, degree=12, period=None, wavelength=1.064e-6, target=0.2,
+                  angular_points=16, angular_quadrature='gauss', emission_range=(1e-6, 25e-6),
+                  emission_rtol=1e-4, max_Starchip_temp=1000, validation_points=200, seed=None, batch_size=128, verbose=True):
+    """Fits a Surrogate of the optics of a stack of materials.
+
+    Parameters
+    ----------
+    materials : list of str
+        Materials in each layer
+    bounds : tuple of two floats, or list of tuples
+        Lower and upper thickness [m] of every layer, or of each layer
+    degree : int or list of ints
+        Degree of the Chebyshev expansion in the thickness of every layer, or
+        of each layer. The exact optics are calculated at (degree+1)**layers
+        thicknesses.
+    period, wavelength, target, angular_points, angular_quadrature, emission_range, emission_rtol
+        As for MultilayerSail
+    max_Starchip_temp : float
+        As for MultilayerSail. The emission quadrature is chosen for the max
+        temperature of the materials and Starchip, so the surrogate only
+        covers sails with this max_Starchip_temp.
+    validation_points : int
+        Number of random thicknesses at which the surrogate is checked against
+        exact calculations
+    seed : int
+        Seed of the random validation thicknesses
+    batch_size : int
+        Number of thicknesses in each TMM call
+    verbose : bool
+        Print the number of exact calculations and the validated errors
+
+    Returns
+    -------
+    Surrogate
+    """
+    layers = len(materials)
+    bounds = np.array(np.broadcast_to(np.asarray(bounds, dtype=float), (layers, 2)))
+    degree = np.broadcast_to(np.asarray(degree, dtype=int), (layers,)).tolist()
+    sail = MultilayerSail(name='surrogate', materials=list(materials), thickness=list(bounds.mean(axis=1)),
+        mass=1, target=target, wavelength=wavelength, angular_points=angular_points,
+        angular_quadrature=angular_quadrature, emission_range=emission_range, emission_rtol=emission_rtol,
+        max_Starchip_temp=max_Starchip_temp, period=period, verbose=False)
+
+    #Emissivity is found at the wavelengths of the quadrature the sail at the
+    #centre of the box uses from a quarter of its max temperature up to it
+    max_temp = sail._find_max_temp()
+    quadrature = sail._emission_quadrature(np.geomspace(max_temp/4, max_temp, 3))
+
+    #Exact optics at the tensor grid of Chebyshev nodes (of the first kind)
+    nodes = [np.cos(pi*(np.arange(d + 1) + 0.5)/(d + 1)) for d in degree]
+    grid = np.stack(np.meshgrid(*nodes, indexing='ij'), axis=-1).reshape(-1, layers)
+    if verbose:
+        print(f'Calculating optics at {len(grid)} thicknesses...')
+    optics = sail._find_batch_optics(_to_thickness(grid, bounds), batch_size=batch_size,
+                                     emission_quadrature=quadrature)
+    #Coefficients: apply the inverse of the Chebyshev-Vandermonde matrix along each axis
+    coefficients = {}
+    shape = [d + 1 for d in degree]
+    for quantity in QUANTITIES:
+        values = optics[quantity].reshape(shape + list(optics[quantity].shape[1:]))
+        for axis, (x, d) in enumerate(zip(nodes, degree)):
+            inverse = np.linalg.inv(chebyshev.chebvander(x, d))
+            values = np.moveaxis(np.tensordot(inverse, values, axes=(1, axis)), 0, axis)
+        coefficients[quantity] = values
+
+    objects = sail._material_objects()
+    metadata = {'materials': list(materials), 'material_versions': list(sail._material_versions),
+                'bounds': bounds.tolist(), 'degree': degree, 'period': None if period is None else list(sail.period),
+                'wavelength': wavelength, 'target': target, 'angular_points': angular_points,
+                'angular_quadrature': angular_quadrature, 'emission_range': list(emission_range),
+                'emission_rtol': emission_rtol, 'max_Starchip_temp': max_Starchip_temp,
+                'densities': [float(mat.get_density()) for mat in objects],
+                'copies': sail._layer_copies().tolist(),
+                'max_temps': [float(mat.get_max_temp()) for mat in objects]}
+    surrogate = Surrogate(coefficients, optics['betas'], *quadrature, metadata)
+
+    #Validation against exact optics at random thicknesses
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-1, 1, (validation_points, layers))
+    exact = sail._find_batch_optics(_to_thickness(x, bounds), batch_size=batch_size, emission_quadrature=quadrature)
+    errors = {}
+    for quantity in QUANTITIES:
+        error = np.abs(surrogate._evaluate(quantity, x) - exact[quantity])
+        scale = np.max(np.abs(exact[quantity]))
+        errors[quantity] = {'max_error': float(np.max(error)), 'rms_error': float(np.sqrt(np.mean(error**2))),
+                            'max_relative_error': float(np.max(error)/scale) if scale > 0 else 0.0}
+    surrogate.metadata['errors'] = errors
+    surrogate.metadata['validation_points'] = validation_points
+    if verbose:
+        surrogate.print_errors()
+    return surrogate
+
+def load_surrogate(path, check=True):
+    """Loads a Surrogate saved with Surrogate.save(). If check is True, raises
+    a ValueError if any material has been saved with different data since the
+    surrogate was fitted."""
+    with np.load(path) as data:
+        metadata = json.loads(str(data['metadata']))
+        coefficients = {quantity: data[quantity] for quantity in QUANTITIES}
+        betas, emission_wavelengths, emission_weights = data['betas'], data['emission_wavelengths'], data['emission_weights']
+    if check:
+        versions = [material_version(mat) for mat in metadata['materials']]
+        if versions != metadata['material_versions']:
+            raise ValueError(f'Materials have changed since the surrogate in {path} was fitted; fit it again')
+    return Surrogate(coefficients, betas, emission_wavelengths, emission_weights, metadata)
+
+def _to_thickness(x, bounds):
+    """Thicknesses [m] from coordinates x in [-1, 1] of the box of bounds."""
+    low, high = bounds[:, 0], bounds[:, 1]
+    return (low + high)/2 + x*(high - low)/2
+
+class Surrogate:
+    """
+    Chebyshev surrogate of the optics of a stack of materials over a box of
+    layer thicknesses (see fit_surrogate).
+
+    ...
+
+    Attributes
+    ----------
+    materials : list of str
+        Materials in each layer
+    bounds : array of floats
+        Lower and upper thickness of each layer [m], shape (layers, 2)
+    betas : array of floats
+        Speeds (as fraction of speed of light) of beta_absorptance
+    emission_wavelengths : array of floats
+        Wavelengths of emissivity [m]
+    emission_weights : array of floats
+        Quadrature weights of the emission wavelengths [m] (see
+        MultilayerSail._emission_quadrature)
+    metadata : dict
+        Settings of the stack, and validated errors ('errors': max, rms and
+        max relative error of each quantity)
+
+    Methods
+    -------
+    reflectance(thickness), transmittance(thickness)
+        Averaged over the Doppler-shifted laser band
+    beta_absorptance(thickness)
+        Absorptance at the laser wavelength Doppler-shifted to each of betas
+    emissivity(thickness)
+        Front plus back hemispherical emissivity at each emission wavelength
+    evaluate(thickness, mass=None, area=None, power=None, max_Starchip_temp=1000)
+        Results of a sail, as for MultilayerSail
+    matches(design)
+        Whether a design (keyword arguments of MultilayerSail) is covered
+    save(path)
+        Saves the surrogate as a .npz file
+    """
+    def __init__(self, coefficients, betas, emission_wavelengths, emission_weights, metadata):
+        """The constructor for Surrogate class. Use fit_surrogate() or load_surrogate()."""
+        self._coefficients = coefficients
+        self.betas = np.asarray(betas)
+        self.emission_wavelengths = np.asarray(emission_wavelengths)
+        self.emission_weights = np.asarray(emission_weights)
+        self.metadata = metadata
+        self.materials = metadata['materials']
+        self.bounds = np.asarray(metadata['bounds'])
+        self._densities = np.array(metadata['densities'])*np.array(metadata['copies'])
+        self._max_temp = min(metadata['max_temps'])
+        self._W_per_root_density = _W_per_root_density(metadata['target'])
+        self._orders = [np.arange(degree + 1) for degree in metadata['degree']]
+        self._low, self._high = self.bounds[:, 0], self.bounds[:, 1]
+
+    def _coordinates(self, thickness):
+        """Coordinates in [-1, 1] of thicknesses (one row per thickness)."""
+        thickness = np.atleast_2d(np.asarray(thickness, dtype=float))
+        low, high = self._low, self._high
+        # Allow for rounding at the bounds
+        tolerance = 1e-9*(high - low)
+        if thickness.shape[-1] != len(low) or not ((thickness >= low - tolerance) & (thickness <= high + tolerance)).all():
+            raise ValueError(f'Thicknesses must be within the bounds of the surrogate: {self.bounds.tolist()}')
+        return np.clip((2*thickness - (low + high))/(high - low), -1, 1)
+
+    def _evaluate(self, quantity, x):
+        """Chebyshev expansion of quantity at coordinates x, shape (points, layers)."""
+        values = self._coefficients[quantity]
+        points = len(x)
+        angles = np.arccos(x)
+        for axis, orders in enumerate(self._orders):
+            # T_k(x) = cos(k arccos(x))
+            vander = np.cos(angles[:, axis, None]*orders)
+            if axis == 0:
+                values = vander @ values.reshape(len(orders), -1)
+            else:
+                values = (vander[:, None, :] @ values.reshape(points, len(orders), -1))[:, 0]
+        return values.reshape((points,) + self._coefficients[quantity].shape[len(self._orders):])
+
+    def _quantity(self, quantity, thickness):
+        values = self._evaluate(quantity, self._coordinates(thickness))
+        return values if np.ndim(thickness) > 1 else values[0]
+
+    def reflectance(self, thickness):
+        """Reflectance averaged over the Doppler-shifted laser band. thickness
+        is a list of the thickness of each layer [m], or an array with one
+        row per sail."""
+        return self._quantity('reflectance', thickness)
+
+    def transmittance(self, thickness):
+        """Transmittance averaged over the Doppler-shifted laser band."""
+        return self._quantity('transmittance', thickness)
+
+    def beta_absorptance(self, thickness):
+        """Absorptance at the laser wavelength Doppler-shifted to each of self.betas."""
+        return self._quantity('beta_absorptance', thickness)
+
+    def emissivity(self, thickness):
+        """Front plus back hemispherical emissivity at each of self.emission_wavelengths."""
+        return self._quantity('emissivity', thickness)
+
+    def power_emitted(self, thickness, T):
+        """Power emitted per unit area [] at temperature T [K], integrated
+        with the emission quadrature as by MultilayerSail."""
+        return _power_emitted(T, self.emission_wavelengths, self.emission_weights, self.emissivity(thickness))
+
+    def evaluate(self, thickness, mass=None, area=None, power=None, max_Starchip_temp=None):
+        """Results of the sail with these thicknesses, found from the surrogate
+        in the same way as MultilayerSail.
+
+        Parameters
+        ----------
+        thickness : list of floats
+            Thickness of each layer [m]
+        mass, area, power, max_Starchip_temp
+            As for MultilayerSail. If power is None, the max power the sail
+            can be subject to is used. max_Starchip_temp defaults to the one
+            the surrogate was fitted for; a different one raises a ValueError.
+
+        Returns
+        -------
+        dict
+            s_density, mass, area, radius, reflectance, transmittance,
+            absorptance (at the laser wavelength), power, W, diameter and
+            temp_reached
+        """
+        if mass is None and area is None:
+            raise ValueError("Enter mass and/or area")
+        if max_Starchip_temp is None:
+            max_Starchip_temp = self.metadata['max_Starchip_temp']
+        elif max_Starchip_temp != self.metadata['max_Starchip_temp']:
+            raise ValueError(f"Surrogate was fitted for max_Starchip_temp = {self.metadata['max_Starchip_temp']}; "
+                             'fit it again for a different one')
+        x = self._coordinates(thickness)
+        s_density = float(np.dot(np.asarray(thickness, dtype=float), self._densities))
+        if mass is None:
+            mass = area*s_density
+        elif area is None:
+            area = mass/s_density
+        reflectance = float(self._evaluate('reflectance', x)[0])
+        beta_absorptance = self._evaluate('beta_absorptance', x)[0]
+        emissivity = self._evaluate('emissivity', x)
+        betas = self.betas
+        absorbed_per_watt = max(np.max(beta_absorptance*(1-betas)/(1+betas))*s_density/mass, 0)
+        max_temp = min(self._max_temp, max_Starchip_temp)
+        def power_emitted(T):
+            return float(_power_emitted(T, self.emission_wavelengths, self.emission_weights, emissivity[0]))
+        if power is None:
+            power = power_emitted(max_temp)/absorbed_per_watt
+            temp_reached = max_temp
+        else:
+            # As MultilayerSail._find_eq_temps_given_abs_coeff
+            power_absorbed = power*absorbed_per_watt
+            a = (power_absorbed/(2*5.67e-8))**0.25
+            b = 2*a
+            while power_emitted(b) < power_absorbed:
+                b *= 2
+            temp_reached = scipy.optimize.brentq(lambda T: power_absorbed - power_emitted(T), a, b)
+        c = 2.998e8 #m/s
+        W = self._W_per_root_density*np.sqrt(s_density*1000)/reflectance
+        wavelength = self.metadata['wavelength']
+        diameter = (2*wavelength*c**3*np.sqrt(mass*1000)*W)/(np.sqrt(np.pi)*1000*power)
+        return {'s_density': s_density, 'mass': mass, 'area': area, 'radius': np.sqrt(area/pi),
+                'reflectance': reflectance, 'transmittance': float(self._evaluate('transmittance', x)[0]),
+                'absorptance': float(beta_absorptance[0]), 'power': power, 'W': W, 'diameter': diameter,
+                'temp_reached': temp_reached}
+
+    def matches(self, design):
+        """Whether the surrogate covers a design (dict of keyword arguments of
+        MultilayerSail): same materials, period, wavelength, target,
+        max_Starchip_temp and emission settings, and thicknesses within
+        bounds."""
+        metadata = self.metadata
+        period = design.get('period')
+        settings = [('wavelength', 1.064e-6), ('target', 0.2), ('angular_points', 16),
+                    ('angular_quadrature', 'gauss'), ('emission_rtol', 1e-4), ('max_Starchip_temp', 1000)]
+        if list(design.get('materials', [])) != self.materials:
+            return False
+        if (None if period is None else list(period)) != metadata['period']:
+            return False
+        if any(design.get(key, default) != metadata.get(key) for key, default in settings):
+            return False
+        if list(design.get('emission_range', (1e-6, 25e-6))) != metadata['emission_range']:
+            return False
+        thickness = np.asarray(design.get('thickness'), dtype=float)
+        return bool(thickness.shape == (len(self.materials),) and np.all(thickness >= self.bounds[:, 0])
+                    and np.all(thickness <= self.bounds[:, 1]))
+
+    def print_errors(self):
+        """Prints the validated errors of each quantity."""
+        print(f"Errors at {self.metadata['validation_points']} random thicknesses:")
+        for quantity, error in self.metadata['errors'].items():
+            print(f"{quantity}: max = {error['max_error']:.3g}, rms = {error['rms_error']:.3g}, "
+                  f"max relative = {error['max_relative_error']:.3g}")
+
+    def save(self, path):
+        """Saves the surrogate as a .npz file (see load_surrogate)."""
+        np.savez(path, metadata=json.dumps(self.metadata), betas=self.betas,
+                 emission_wavelengths=self.emission_wavelengths, emission_weights=self.emission_weights,
+                 **self._coefficients)
@@ -0,0 +1,250 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+import numpy as np
+from Starshot.sail import Sail
+from Starshot.multilayer_sail import MultilayerSail
+from Starshot.materials.save_load_mat import preload
+from Starshot.motion import state_vs_t, fleet_state_vs_t
+
+#Columns of the results, in order
+FIELDS = ['index', 'name', 'materials', 'thickness', 'mass', 'area', 'target', 'wavelength',
+          'power', 'reflectance', 'absorptance', 'W', 'diameter', 'temp_reached',
+          'final_beta', 'distance', 'time', 'surrogate', 'error']
+
+#Surrogate of the worker process (see sweep)
+_surrogate = None
+#Mission options (of motion.state_vs_t) that designs evaluated with the
+#surrogate support; method may only be 'rk4'
+_FLEET_OPTIONS = ('method', 'stop_at_target', 'max_dist', 't_eval', 't_max')
+
+def grid(**parameters):
+    """Makes every combination of the given sail parameters.
+
+    Parameters
+    ----------
+    parameters
+        Keyword arguments of MultilayerSail (or Sail), each a list of values,
+        e.g. materials=[['SiO2'], ['SiO2', 'gap', 'SiO2']], wavelength=[1.064e-6, 1.2e-6].
+        Parameters with a single value may be given without a list (except
+        materials and thickness, which are always lists of lists).
+
+    Returns
+    -------
+    list of dicts
+        One dict of keyword arguments per design
+    """
+    keys = list(parameters)
+    values = []
+    for key in keys:
+        value = parameters[key]
+        if key in ('materials', 'thickness'):
+            value = [value] if isinstance(value[0], (str, float, int)) else value
+        elif not isinstance(value, (list, tuple, np.ndarray)):
+            value = [value]
+        values.append(value)
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+def sample(n, seed=None, **parameters):
+    """Draws n random designs.
+
+    Parameters
+    ----------
+    int
+        n
+            - number of designs
+    int (optional)
+        seed
+            - seed of the random number generator
+    parameters
+        Keyword arguments of MultilayerSail (or Sail). Each value is one of
+            - a list: a value is chosen from it at random
+            - a tuple (low, high): a float is drawn uniformly from [low, high)
+            - a function of a numpy Generator returning a value, e.g. for
+              thickness, lambda rng: list(rng.uniform(10e-9, 1e-6, 3))
+            - anything else: used as is
+
+    Returns
+    -------
+    list of dicts
+        One dict of keyword arguments per design
+    """
+    rng = np.random.default_rng(seed)
+    designs = []
+    for _ in range(n):
+        design = {}
+        for key, value in parameters.items():
+            if callable(value):
+                design[key] = value(rng)
+            elif isinstance(value, list):
+                design[key] = value[rng.integers(len(value))]
+            elif isinstance(value, tuple) and len(value) == 2:
+                design[key] = rng.uniform(*value)
+            else:
+                design[key] = value
+        designs.append(design)
+    return designs
+
+def sweep(designs, outfile=None, mission=None, processes=None, chunksize=None, surrogate=None, verbose=True):
+    """Builds and evaluates a sail for every design across a pool of processes.
+    A design with materials is a MultilayerSail, otherwise a Sail. Sails are
+    built with verbose=False. A design that raises an error is recorded with
+    the error message rather than stopping the sweep.
+
+    Parameters
+    ----------
+    list of dicts
+        designs
+            - keyword arguments of each sail, e.g. from grid() or sample().
+              A name is made up if not given.
+    str (optional)
+        outfile
+            - path of a csv file that results are written to as they arrive
+    dict (optional)
+        mission
+            - if given, the mission is also calculated with these keyword
+              arguments of motion.state_vs_t (defaults to method='RK45' and
+              stop_at_target=True), and the final speed, distance and time
+              are recorded
+    int (optional)
+        processes
+            - number of worker processes. Defaults to the number of CPUs.
+              With 1, designs are evaluated in this process.
+    int (optional)
+        chunksize
+            - number of designs sent to a worker at a time. Defaults to
+              spreading the designs over about 4 chunks per process.
+    Surrogate (optional)
+        surrogate
+            - designs that it covers (see surrogate.Surrogate.matches) are
+              evaluated with it instead of being built, and their mission
+              (if any) is integrated with motion.fleet_state_vs_t to the
+              target speed (only the mission options stop_at_target,
+              max_dist, t_eval, t_max and method='rk4' apply to it; others
+              are recorded as an error). The surrogate column records which
+              designs were.
+    bool (optional)
+        verbose
+            - print progress and throughput
+
+    Returns
+    -------
+    list of dicts
+        Results of each design, in the order of designs, with keys FIELDS
+    """
+    designs = list(designs)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(designs) // (4*processes))
+    #Materials are loaded once per process, not once per sail
+    names = sorted({name for design in designs for name in design.get('materials', [])})
+    tasks = [(i, design, mission) for i, design in enumerate(designs)]
+
+    results = []
+    start = time.perf_counter()
+    f = open(outfile, 'w', newline='') if outfile is not None else None
+    try:
+        writer = None
+        if f is not None:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+        if processes == 1:
+            _init_worker(names, surrogate)
+            rows = map(_evaluate, tasks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(names, surrogate))
+            rows = pool.imap(_evaluate, tasks, chunksize=chunksize)
+        try:
+            for row in rows:
+                results.append(row)
+                if writer is not None:
+                    writer.writerow(row)
+                    f.flush()
+                if verbose and (len(results) % chunksize == 0 or len(results) == len(designs)):
+                    elapsed = time.perf_counter() - start
+                    print(f'{len(results)}/{len(designs)} designs, {elapsed:.1f} s, '
+                          f'{len(results)/elapsed:.2f} designs/s')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    finally:
+        if f is not None:
+            f.close()
+    if verbose:
+        failed = sum(1 for row in results if row['error'])
+        print(f'{len(results)} designs evaluated ({failed} failed)')
+    return results
+
+def _init_worker(names, surrogate=None):
+    """Pre-warm the material registry of a worker process and set its
+    surrogate. Missing materials are skipped here; the designs using them
+    record the error."""
+    global _surrogate
+    _surrogate = surrogate
+    for name in names:
+        try:
+            preload([name])
+        except ValueError:
+            pass
+
+def _evaluate(task):
+    """Build the sail of one design and collect its results."""
+    index, design, mission = task
+    design = dict(design)
+    design.setdefault('name', f'design {index}')
+    row = {field: None for field in FIELDS}
+    row['index'] = index
+    row['name'] = design['name']
+    try:
+        row['surrogate'] = _surrogate is not None and _surrogate.matches(design)
+        if row['surrogate']:
+            return _evaluate_surrogate(row, design, mission)
+        if 'materials' in design:
+            sail = MultilayerSail(verbose=False, **design)
+        else:
+            sail = Sail(**design)
+        for field in FIELDS[2:14]:
+            row[field] = getattr(sail, field, None)
+        if mission is not None:
+            options = dict(mission)
+            options.setdefault('method', 'RK45')
+            options.setdefault('stop_at_target', True)
+            state, t = state_vs_t(sail, **options)
+            row['final_beta'], row['distance'] = state[0][-1], state[1][-1]
+            row['time'] = t[-1]
+    except Exception as error:
+        row['error'] = f'{type(error).__name__}: {error}'
+    return row
+
+def _evaluate_surrogate(row, design, mission):
+    """Collect the results of one design from the surrogate."""
+    results = _surrogate.evaluate(design['thickness'], mass=design.get('mass'), area=design.get('area'),
+        power=design.get('power'), max_Starchip_temp=design.get('max_Starchip_temp', 1000))
+    metadata = _surrogate.metadata
+    row.update(materials=design['materials'], thickness=design['thickness'], target=metadata['target'],
+               wavelength=metadata['wavelength'])
+    for field in FIELDS[4:14]:
+        if field in results:
+            row[field] = results[field]
+    if mission is not None:
+        #fleet_state_vs_t integrates with fixed-step Runge-Kutta on the time
+        #grid, so only the options that apply to it can be forwarded
+        options = dict(mission)
+        unsupported = [option for option in options if option not in _FLEET_OPTIONS]
+        if options.get('method', 'rk4') != 'rk4':
+            unsupported.append(f"method={options['method']!r}")
+        if unsupported:
+            raise ValueError(f"Mission options {', '.join(unsupported)} are not supported for designs "
+                             "evaluated with the surrogate (they are integrated with motion.fleet_state_vs_t)")
+        target = metadata['target'] if options.get('stop_at_target', True) else None
+        _, t, t_stop, x_stop = fleet_state_vs_t(results['mass'], results['power'], results['radius'],
+            results['diameter'], metadata['wavelength'], results['reflectance'], target=target,
+            max_dist=options.get('max_dist'), t_eval=options.get('t_eval'), t_max=options.get('t_max', 1e4))
+        row['final_beta'], row['distance'] = x_stop[0][0], x_stop[1][0]
+        row['time'] = t[-1] if np.isnan(t_stop[0]) else t_stop[0]
+    return row
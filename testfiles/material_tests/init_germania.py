@@ -1,6 +1,6 @@
 from Starshot.materials.material import Material
 
-# #Initialise germania. Saves GeO2.pkl into saved_materials directory. Note that path is given to a file
+# #Initialise germania. Saves GeO2 into saved_materials directory. Note that path is given to a file
 # #containing refractive index/extinction coefficient vs wavelength. A flag is also given (1, 2 or 3).
 # #Flag 2 is given since wavelengths are in microns.
 # #1 is for metres, 2 is for nanometres, 4 is for wavenumber.
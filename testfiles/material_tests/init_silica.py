@@ -1,12 +1,13 @@
 from Starshot.materials.material import Material
 
-#Initialise silica. Saves SiO2.pkl into saved_materials directory.
+#Initialise silica. Saves SiO2 into saved_materials directory.
 silica = Material(name="SiO2", density=2.196e3, max_temp=1000, abs_coeff=1e-3, n_list_path = None, k_list_path = None)
 
 #Print variables.
 silica.print_variables()
 
 #Instead of a table of refractive index vs wavelength, we can add equations. A guide on how to define these equations is written in n_sio2_kkg.py!!!
+#These equations are slow to evaluate; add tabulate=True to interpolate them from a dense, error-checked table instead.
 silica.add_equation(name="n_kkg", range=(1e-6, 25e-6), filepath="n_sio2_kkg.py", n_or_k="n")
 silica.add_equation(name="k_kkg", range=(1e-6, 25e-6), filepath="k_sio2_kkg.py", n_or_k="k")
 
@@ -0,0 +1,49 @@
+#Checks the emitted power curve that thermal queries are looked up on once a
+# sail has been asked several of them (see MultilayerSail._power_emitted_curve).
+# Every lookup should agree with a direct solve, and sails whose curve cannot
+# be built should be solved for directly instead of raising an error.
+
+#Import MultilayerSail class
+import numpy as np
+from Starshot.multilayer_sail import MultilayerSail
+
+def check_lookups(sail, powers=(1e9, 3e9, 1e10, 3e10)):
+    """Asks for the equilibrium temperature at several powers (enough for the
+    curve to be built) and compares each with a direct solve."""
+    for power in powers:
+        temp = sail.equilibrium_temp(power)
+        solved = sail._solve_eq_temp(power*sail._find_absorbed_power_per_watt())
+        assert abs(temp - solved) <= 1e-3*solved, (sail.materials, power, temp, solved)
+
+#Sails whose nodes were not monotone after the last refinement
+designs = [dict(materials=['SiO2','SiO2'], thickness=[150e-9,250e-9]),
+    dict(materials=['SiO2','SiO2','gap','SiO2'], thickness=[100e-9,200e-9,400e-9,150e-9]),
+    dict(materials=['gap','SiO2','gap','SiO2'], thickness=[300e-9,120e-9,300e-9,120e-9]),
+    dict(materials=['SiO2','gap','SiO2','gap','SiO2'], thickness=[100e-9,300e-9,100e-9,300e-9,100e-9],
+         period=(1, 3, 3))]
+for i, design in enumerate(designs):
+    sail = MultilayerSail(name=f'curve_{i}', mass=0.001, wavelength=1.2e-6, power=1e10, verbose=False, **design)
+    check_lookups(sail)
+    print(design['materials'], 'curve built:', sail._power_emitted_curve() is not None, 'temp_reached =', sail.temp_reached)
+
+#Exhausted refinement: the curve is not used, and temperatures are solved for
+sail = MultilayerSail(name='S3', materials=['SiO2','gap','SiO2'], mass=0.001, thickness=[197e-9,399e-9,197e-9],
+    wavelength=1.2e-6, power=1e10, verbose=False)
+sail._power_emitted_cache = None
+sail._CURVE_QUERIES = 1
+assert sail._power_emitted_curve(max_refinements=0) is None
+check_lookups(sail)
+
+#Emitted power that is not increasing at the nodes (e.g. integration noise):
+# the curve is not used, and temperatures are solved for
+sail = MultilayerSail(name='S3', materials=['SiO2','gap','SiO2'], mass=0.001, thickness=[197e-9,399e-9,197e-9],
+    wavelength=1.2e-6, power=1e10, verbose=False)
+find_power_emitted = sail._find_power_emitted
+sail._find_power_emitted = lambda T: find_power_emitted(T)*(1 + 0.5*np.sin(T))
+sail._power_emitted_cache = None
+sail._CURVE_QUERIES = 1
+assert sail._power_emitted_curve() is None
+sail._find_power_emitted = find_power_emitted
+check_lookups(sail)
+
+print('All thermal lookup checks passed')
@@ -0,0 +1,130 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+""" Opt-in, bounded least-recently-used cache of TMM results. Results are
+    keyed by a canonical hash of the structure (the (n, d) of every layer),
+    the wavelength(s) and the angle(s), so repeated evaluations of the same
+    structure (e.g. front/back emissivity, identical sails in a sweep) are
+    only calculated once.
+
+    The cache is disabled by default. Use enable_cache() to turn it on; it is
+    then used by every call to tmm() and tmm_batch().
+"""
+
+class TMMCache:
+    """
+    Bounded LRU cache of TMM results.
+
+    ...
+
+    Attributes
+    ----------
+    max_bytes : int
+        Memory budget for stored results [bytes]
+    nbytes : int
+        Memory currently used by stored results [bytes]
+    hits : int
+        Number of lookups that found a stored result
+    misses : int
+        Number of lookups that did not
+    """
+    def __init__(self, max_bytes=64*2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    @staticmethod
+    def make_key(matrix_params, wavelengths, thetas):
+        """Canonical hash of a structure, wavelength(s) and angle(s)."""
+        h = hashlib.blake2b(digest_size=20)
+        TMMCache._hash_structure(h, matrix_params)
+        for value in (wavelengths, thetas):
+            arr = np.ascontiguousarray(value, dtype=float)
+            h.update(str(arr.shape).encode())
+            h.update(arr.tobytes())
+        return h.digest()
+
+    @staticmethod
+    def _hash_structure(h, matrix_params):
+        """Add the (n, d) of every layer to hash h. Periodic elements are hashed
+        as their repeat count and unit cell."""
+        for params in matrix_params:
+            if hasattr(params, 'repeats'):
+                h.update(f'periodic {params.repeats} {len(params.cell)}'.encode())
+                TMMCache._hash_structure(h, params.cell)
+                continue
+            n, d = params
+            for value, dtype in ((n, complex), (d, float)):
+                arr = np.ascontiguousarray(value, dtype=dtype)
+                h.update(str(arr.shape).encode())
+                h.update(arr.tobytes())
+
+    def get(self, key):
+        """Return stored result for key, or None."""
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """Store result (a tuple of arrays), evicting least recently used
+        results until the memory budget is met."""
+        size = sum(arr.nbytes for arr in result)
+        if size > self.max_bytes or key in self._results:
+            return
+        for arr in result:
+            arr.flags.writeable = False #Stored arrays are shared by every caller
+        self._results[key] = result
+        self.nbytes += size
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used results until the memory budget is met."""
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._results.popitem(last=False)
+            self.nbytes -= sum(arr.nbytes for arr in evicted)
+
+    def clear(self):
+        """Remove all stored results and reset counters."""
+        self._results.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Return dict of hits, misses, number of entries, nbytes and max_bytes."""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._results),
+                'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+_cache = None
+
+def enable_cache(max_bytes=64*2**20):
+    """Turn on the TMM cache with a memory budget [bytes]. Returns the cache."""
+    global _cache
+    if _cache is None:
+        _cache = TMMCache(max_bytes)
+    else:
+        _cache.max_bytes = max_bytes
+        _cache.evict()
+    return _cache
+
+def disable_cache():
+    """Turn off and empty the TMM cache."""
+    global _cache
+    _cache = None
+
+def get_cache():
+    """Return the TMM cache, or None if it is disabled."""
+    return _cache
+
+def cache_info():
+    """Return hit/miss counters and memory use of the TMM cache, or None if it is disabled."""
+    if _cache is None:
+        return None
+    return _cache.info()
@@ -6,8 +6,24 @@ from numpy import sin, cos, pi
     the refractive index, and d is the thickness of the layer. Returns the
     correct transfer matrix. Also needs a wavenumber as input (calculated from
     tmm to reduce computational time).
+
+    n, d, wavenumber and angle may also be NumPy arrays, in which case they are
+    broadcast against each other and a stack of matrices with shape
+    (..., 2, 2) is returned, one for each broadcast point.
 """
 
+def _stack_matrix(M_11, M_12, M_21, M_22):
+    """ Stacks the four (broadcastable) matrix elements into an array of
+        shape (..., 2, 2).
+    """
+    M_11, M_12, M_21, M_22 = np.broadcast_arrays(M_11, M_12, M_21, M_22)
+    M = np.empty(M_11.shape + (2, 2), dtype=complex)
+    M[..., 0, 0] = M_11
+    M[..., 0, 1] = M_12
+    M[..., 1, 0] = M_21
+    M[..., 1, 1] = M_22
+    return M
+
 def make_p_transfer_matrix(matrix_params, wavenumber, angle):
     n, d = matrix_params
     k = wavenumber*n
@@ -20,7 +36,7 @@ def make_p_transfer_matrix(matrix_params, wavenumber, angle):
     M_12 = 1j*sin(delta)/eng
     M_21 = 1j*eng*sin(delta)
     M_22 = cos(delta)
-    M = [[M_11, M_12], [M_21, M_22]]
+    M = _stack_matrix(M_11, M_12, M_21, M_22)
     return M
 
 def make_s_transfer_matrix(matrix_params, wavenumber, angle):
@@ -35,5 +51,69 @@ def make_s_transfer_matrix(matrix_params, wavenumber, angle):
     M_12 = 1j*sin(delta)/eng
     M_21 = 1j*eng*sin(delta)
     M_22 = cos(delta)
-    M = [[M_11, M_12], [M_21, M_22]]
+    M = _stack_matrix(M_11, M_12, M_21, M_22)
     return M
+
+def make_transfer_matrix_derivatives(matrix_params, wavenumber, angle, polarisation):
+    """ Derivatives of the transfer matrix of one layer with respect to its
+        thickness d and its complex refractive index n (matrix_params = (n, d)),
+        where angle is the angle of refraction in the layer and polarisation
+        is 'p' or 's'.
+
+        The matrix is a holomorphic function of n, so the derivative with
+        respect to the real part of n is dM/dn and the derivative with respect
+        to the extinction coefficient k (n = n' + ik) is 1j*dM/dn.
+
+        Returns (dM/dd, dM/dn), each with shape (..., 2, 2).
+    """
+    n, d = matrix_params
+    k = wavenumber*n
+    q = cos(angle)
+    dq_dn = sin(angle)**2/(n*q)     # from q**2 = 1 - (sin(theta_0)/n)**2
+
+    delta = k*d*q
+    if polarisation == 'p':
+        eng = 1j*k/q
+        deng_dn = 1j*(wavenumber*q - k*dq_dn)/q**2
+    elif polarisation == 's':
+        eng = 1j*k*q
+        deng_dn = 1j*(wavenumber*q + k*dq_dn)
+    ddelta_dd = k*q
+    ddelta_dn = d*(wavenumber*q + k*dq_dn)
+
+    # Partial derivatives of the matrix elements with respect to delta and eng
+    dM_ddelta = _stack_matrix(-sin(delta), 1j*cos(delta)/eng, 1j*eng*cos(delta), -sin(delta))
+    dM_deng = _stack_matrix(0, -1j*sin(delta)/eng**2, 1j*sin(delta), 0)
+
+    dM_dd = dM_ddelta*np.asarray(ddelta_dd)[..., None, None]
+    dM_dn = dM_ddelta*np.asarray(ddelta_dn)[..., None, None] + dM_deng*np.asarray(deng_dn)[..., None, None]
+    return dM_dd, dM_dn
+
+def matrix_power(M, repeats):
+    """ Raises a stack of unimodular (det = 1) 2x2 matrices, shape (..., 2, 2),
+        to the integer power repeats, at a cost independent of repeats.
+
+        Every transfer matrix, and so every product of them (e.g. the matrix of
+        the unit cell of a periodic stack), is unimodular. By the Cayley-Hamilton
+        theorem (Abeles' formula),
+            M^N = U_{N-1}(a) M - U_{N-2}(a) I,    a = trace(M)/2,
+        where U are Chebyshev polynomials of the second kind,
+        U_{N-1}(cos(theta)) = sin(N theta)/sin(theta).
+    """
+    if repeats == 0:
+        return np.broadcast_to(np.identity(2, dtype=complex), M.shape).copy()
+    if repeats == 1:
+        return M
+    a = (M[..., 0, 0] + M[..., 1, 1])/2
+    theta = np.arccos(a.astype(complex))
+    sin_theta = sin(theta)
+    # At a = +-1 (band edges) sin(theta) = 0; use the limit U_{N-1}(+-1) = N (+-1)^(N-1)
+    edge = np.abs(sin_theta) < 1e-8
+    safe_sin_theta = np.where(edge, 1, sin_theta)
+    with np.errstate(over='ignore', invalid='ignore'):
+        U_1 = np.where(edge, repeats*a**(repeats-1), sin(repeats*theta)/safe_sin_theta)
+        U_2 = np.where(edge, (repeats-1)*a**(repeats-2), sin((repeats-1)*theta)/safe_sin_theta)
+    M_N = U_1[..., None, None]*M
+    M_N[..., 0, 0] -= U_2
+    M_N[..., 1, 1] -= U_2
+    return M_N
@@ -1,7 +1,8 @@
 import scipy
 import numpy as np
 from numpy import sin, cos, pi, arcsin
-from .make_transfer_matrix import make_p_transfer_matrix, make_s_transfer_matrix
+from .make_transfer_matrix import make_p_transfer_matrix, make_s_transfer_matrix, make_transfer_matrix_derivatives, matrix_power
+from .cache import get_cache
 
 """ This function will take a set of transfer matrices and return in a double
     (r,t), the reflectivity and transmittance coefficients. From these,
@@ -20,36 +21,319 @@ from .make_transfer_matrix import make_p_transfer_matrix, make_s_transfer_matrix
     change as you go down layers due to refraction. Remember theta in radians.
     Notably, we need to consider p and s polarisations, so we have two r's and
     two t's which will be returned
+
+    A group of layers repeated N times may be entered as a single
+    Periodic(cell, N) element, where cell is a tuple of (n, d) in the same
+    format. Its matrix is the matrix of the cell raised to the power N, so the
+    cost does not depend on N.
 """
 
-def tmm(matrix_params, wavelength, theta):
+class Periodic:
+    """ A unit cell of layers, ((n_1, d_1), ..., (n_m, d_m)), repeated
+        repeats times, as an element of matrix_params.
+    """
+    def __init__(self, cell, repeats):
+        self.cell = tuple(cell)
+        self.repeats = int(repeats)
+
+    def __repr__(self):
+        return f'Periodic({self.cell!r}, {self.repeats})'
+
+def expand(matrix_params):
+    """ Replaces every Periodic element of matrix_params with its layers. """
+    layers = []
+    for params in matrix_params:
+        if isinstance(params, Periodic):
+            layers.extend(expand(params.cell)*params.repeats)
+        else:
+            layers.append(params)
+    return layers
+
+def _shapes(matrix_params):
+    """ Shapes of every n and d in matrix_params, for broadcasting. """
+    shapes = []
+    for params in matrix_params:
+        if isinstance(params, Periodic):
+            shapes.extend(_shapes(params.cell))
+        else:
+            shapes.extend(np.shape(value) for value in params)
+    return shapes
+
+def tmm_batch(matrix_params, wavelengths, thetas):
+    """ Vectorised version of tmm(). Takes the same structure as tmm(), but
+        wavelengths and thetas may be NumPy arrays (or floats), which are
+        broadcast against each other. The refractive index (and thickness) of
+        each layer may also be an array broadcastable to the same shape, e.g.
+        when the optical constants have been evaluated at every wavelength.
+
+        Every layer matrix is built for all points at once and the products
+        are taken over the stacked (..., 2, 2) arrays, so the only Python
+        loop is over the layers.
+
+        Returns (r_p, t_p, r_s, t_s) as complex arrays with the broadcast
+        shape of the inputs. If the TMM cache is enabled (see cache.py), the
+        result is looked up there first.
+    """
+    return _cached(_tmm_batch, matrix_params, wavelengths, thetas)
+
+def tmm_both_sides(matrix_params, wavelengths, thetas):
+    """ Same as tmm_batch(), but returns the coefficients for light incident
+        on both sides of the structure from a single matrix product:
+        ((r_p, t_p, r_s, t_s) front, (r_p, t_p, r_s, t_s) back), where the
+        front is the side tmm() sees and the back is that of the reversed
+        structure.
+
+        Every layer matrix has equal diagonal elements, so reversing the order
+        of the layers gives the same characteristic matrix with its diagonal
+        elements interchanged (M_11 <-> M_22). No second product is needed.
+        Transmission is the same from both sides (reciprocity); reflection
+        differs for lossy, asymmetric stacks.
+    """
+    result = _cached(_tmm_both_sides, matrix_params, wavelengths, thetas)
+    return result[:4], result[4:]
+
+def _cached(func, matrix_params, wavelengths, thetas):
+    """ Calls func(matrix_params, wavelengths, thetas), looking up the result
+        in the TMM cache first if it is enabled (see cache.py).
+    """
+    cache = get_cache()
+    if cache is None:
+        return func(matrix_params, wavelengths, thetas)
+    key = cache.make_key(matrix_params, wavelengths, thetas) + func.__name__.encode()
+    result = cache.get(key)
+    if result is None:
+        result = func(matrix_params, wavelengths, thetas)
+        cache.put(key, result)
+    return result
+
+def _tmm_batch(matrix_params, wavelengths, thetas):
+    """ Uncached tmm_batch(). """
+    M_p, M_s, k0, thetas = _characteristic_matrices(matrix_params, wavelengths, thetas)
+    return tuple(np.asarray(c) for c in _coefficients_from_matrices(M_p, M_s, k0, thetas))
+
+def _tmm_both_sides(matrix_params, wavelengths, thetas):
+    """ Uncached tmm_both_sides(), with front and back coefficients in one tuple. """
+    M_p, M_s, k0, thetas = _characteristic_matrices(matrix_params, wavelengths, thetas)
+    front = _coefficients_from_matrices(M_p, M_s, k0, thetas)
+    back = _coefficients_from_matrices(_swap_diagonal(M_p), _swap_diagonal(M_s), k0, thetas)
+    return tuple(np.asarray(c) for c in front + back)
+
+def _swap_diagonal(M):
+    """ Characteristic matrix of the reversed structure: M_11 <-> M_22. """
+    M = M.copy()
+    M[..., 0, 0], M[..., 1, 1] = M[..., 1, 1], M[..., 0, 0].copy()
+    return M
+
+def _characteristic_matrices(matrix_params, wavelengths, thetas):
+    """ Finds the stacked p and s characteristic matrices of the structure.
+        Returns (M_p, M_s, k0, thetas), with thetas as an array.
+    """
+    n0 = 1                  # refractive index of vacuum
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    thetas = np.asarray(thetas, dtype=float)
+    shape = np.broadcast_shapes(wavelengths.shape, thetas.shape, *_shapes(matrix_params))
+    k0 = n0*2*pi/wavelengths    # WAVELENGTH IN METRES
+    M_p, M_s = _product(matrix_params, k0, thetas, shape)
+    return M_p, M_s, k0, thetas
+
+def _product(matrix_params, k0, thetas, shape):
+    """ Characteristic p and s matrices of matrix_params, which may contain
+        Periodic elements.
+    """
     n0 = 1                  # refractive index of vacuum
-    k0 = n0*2*pi/wavelength     # WAVELENGTH IN METRES
-    p_field_vector = [[1],[1j*k0/cos(theta)]]
-    s_field_vector = [[1],[1j*k0*cos(theta)]]
-    M_p = np.array([[1,0],[0,1]])
-    M_s = np.array([[1,0],[0,1]])
-
-    # Here, we need to just make the matrices and continue to left-multiply them
-    # to the field vector, beginning with M_1, ending at M_m
-    for matrix_param in matrix_params:
-        new_theta = arcsin(n0/matrix_param[0]*sin(theta))       # Simple and speedy
-        M_p = np.matmul(make_p_transfer_matrix(matrix_param, k0, new_theta), M_p)
-        M_s = np.matmul(make_s_transfer_matrix(matrix_param, k0, new_theta), M_s)
-
-    p_field_vector = np.matmul(M_p,p_field_vector)
-    s_field_vector = np.matmul(M_s,s_field_vector)
-    # The field vector is now the col vector (alpha,beta), which we can use to
-    # find r, t:
+    M_p = np.broadcast_to(np.identity(2, dtype=complex), shape + (2, 2))
+    M_s = M_p
+
+    # Left-multiply the layer matrices, beginning with M_1, ending at M_m
+    for params in matrix_params:
+        if isinstance(params, Periodic):
+            cell_p, cell_s = _product(params.cell, k0, thetas, shape)
+            M_p = np.matmul(matrix_power(cell_p, params.repeats), M_p)
+            M_s = np.matmul(matrix_power(cell_s, params.repeats), M_s)
+            continue
+        n, d = params
+        new_theta = arcsin(n0/np.asarray(n)*sin(thetas))
+        M_p = np.matmul(make_p_transfer_matrix((n, d), k0, new_theta), M_p)
+        M_s = np.matmul(make_s_transfer_matrix((n, d), k0, new_theta), M_s)
+
+    return M_p, M_s
+
+def tmm_gradient(matrix_params, wavelengths, thetas, both_sides=False):
+    """ Same as tmm_batch(), but also returns the derivatives of r_p, t_p, r_s
+        and t_s with respect to the thickness d and the complex refractive
+        index n of every layer, calculated analytically in the same pass.
+
+        The characteristic matrix is M = L_m ... L_1, so its derivative with
+        respect to a parameter of layer j is (L_m ... L_j+1) dL_j (L_j-1 ... L_1).
+        The prefix and suffix products are built once, so every derivative
+        costs two extra matrix products.
+
+        The coefficients are holomorphic in n, so the derivative with respect
+        to the real part of n is the 'n' derivative and with respect to the
+        extinction coefficient k is 1j times it. Remember that d is entered
+        as a NEGATIVE distance, so the derivative with respect to the layer
+        thickness is minus the 'd' derivative. The derivative of a
+        reflectance R = |r|**2 is 2*Re(conj(r)*dr).
+
+        Returns (coefficients, gradients), where coefficients is
+        (r_p, t_p, r_s, t_s) and gradients is a dict with arrays 'd' and 'n'
+        of shape (layers, 4, ...), in the order of the coefficients.
+        If both_sides is True, returns ((coefficients, gradients) front,
+        (coefficients, gradients) back) as in tmm_both_sides().
+
+        Periodic elements are expanded, so there is a derivative for every
+        layer of every repeat.
+    """
+    matrix_params = expand(matrix_params)
+    n0 = 1                  # refractive index of vacuum
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    thetas = np.asarray(thetas, dtype=float)
+    shape = np.broadcast_shapes(wavelengths.shape, thetas.shape,
+        *[np.shape(n) for n, _ in matrix_params], *[np.shape(d) for _, d in matrix_params])
+    k0 = n0*2*pi/wavelengths    # WAVELENGTH IN METRES
+    identity = np.broadcast_to(np.identity(2, dtype=complex), shape + (2, 2))
+
+    results = {}
+    for polarisation, make_transfer_matrix in (('p', make_p_transfer_matrix), ('s', make_s_transfer_matrix)):
+        layers = []
+        derivatives = []
+        for n, d in matrix_params:
+            new_theta = arcsin(n0/np.asarray(n)*sin(thetas))
+            layers.append(make_transfer_matrix((n, d), k0, new_theta))
+            derivatives.append(make_transfer_matrix_derivatives((n, d), k0, new_theta, polarisation))
+        # prefix[j] = L_j-1 ... L_0 and suffix[j] = L_m-1 ... L_j+1 (0-indexed)
+        prefix = [identity]
+        for L in layers:
+            prefix.append(np.matmul(L, prefix[-1]))
+        suffix = [identity]*len(layers)
+        for j in range(len(layers) - 2, -1, -1):
+            suffix[j] = np.matmul(suffix[j+1], layers[j+1])
+        M = prefix[-1]
+        dM_dd = np.array([suffix[j] @ dL_dd @ prefix[j] for j, (dL_dd, _) in enumerate(derivatives)]).reshape((-1,) + shape + (2, 2))
+        dM_dn = np.array([suffix[j] @ dL_dn @ prefix[j] for j, (_, dL_dn) in enumerate(derivatives)]).reshape((-1,) + shape + (2, 2))
+        results[polarisation] = (M, dM_dd, dM_dn)
+
+    def coefficients_and_gradients(swap):
+        transform = _swap_diagonal if swap else (lambda M: M)
+        M_p, dM_p_dd, dM_p_dn = [transform(M) for M in results['p']]
+        M_s, dM_s_dd, dM_s_dn = [transform(M) for M in results['s']]
+        coefficients = tuple(np.asarray(c) for c in _coefficients_from_matrices(M_p, M_s, k0, thetas))
+        gradients = {}
+        for name, dM_p, dM_s in (('d', dM_p_dd, dM_s_dd), ('n', dM_p_dn, dM_s_dn)):
+            dr_p, dt_p = _coefficient_derivatives(M_p, dM_p, 1j*k0/cos(thetas))
+            dr_s, dt_s = _coefficient_derivatives(M_s, dM_s, 1j*k0*cos(thetas))
+            gradients[name] = np.stack((dr_p, dt_p, dr_s, dt_s), axis=1)
+        return coefficients, gradients
+
+    if both_sides:
+        # The reversed structure has M_11 and M_22 interchanged, and so do
+        # its derivatives
+        return coefficients_and_gradients(False), coefficients_and_gradients(True)
+    return coefficients_and_gradients(False)
+
+class IncrementalTMM:
+    """ Coefficients of a structure in which one element of matrix_params at
+        a time is changed, e.g. one thickness in coordinate descent.
+
+        The prefix products (L_j-1 ... L_1) and suffix products
+        (L_m ... L_j+1) of the element matrices are kept for every wavelength
+        and angle, so the coefficients with element j replaced are found from
+        the matrix of the new element and two matrix products, whatever the
+        number of layers.
+
+        The new element must broadcast to the same shape as the structure
+        (e.g. same wavelengths). An element may be a Periodic.
+    """
+    def __init__(self, matrix_params, wavelengths, thetas):
+        n0 = 1                  # refractive index of vacuum
+        self.matrix_params = list(matrix_params)
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        self.thetas = np.asarray(thetas, dtype=float)
+        self.shape = np.broadcast_shapes(wavelengths.shape, self.thetas.shape, *_shapes(self.matrix_params))
+        self.k0 = n0*2*pi/wavelengths    # WAVELENGTH IN METRES
+        self._layers = [self._matrices(params) for params in self.matrix_params]
+        self._products()
+
+    def _matrices(self, params):
+        """ (L_p, L_s) of one element. """
+        return _product([params], self.k0, self.thetas, self.shape)
+
+    def _products(self):
+        """ prefix[j] = L_j-1 ... L_0 and suffix[j] = L_m-1 ... L_j+1 (0-indexed),
+            for each polarisation.
+        """
+        identity = np.broadcast_to(np.identity(2, dtype=complex), self.shape + (2, 2))
+        self._prefix = [(identity, identity)]
+        for L_p, L_s in self._layers:
+            M_p, M_s = self._prefix[-1]
+            self._prefix.append((np.matmul(L_p, M_p), np.matmul(L_s, M_s)))
+        self._suffix = [(identity, identity)]*len(self._layers)
+        for j in range(len(self._layers) - 2, -1, -1):
+            (S_p, S_s), (L_p, L_s) = self._suffix[j+1], self._layers[j+1]
+            self._suffix[j] = (np.matmul(S_p, L_p), np.matmul(S_s, L_s))
+
+    def coefficients(self, both_sides=False):
+        """ (r_p, t_p, r_s, t_s) of the structure, as tmm_batch() (or as
+            tmm_both_sides() if both_sides is True).
+        """
+        M_p, M_s = self._prefix[-1]
+        return self._coefficients(M_p, M_s, both_sides)
+
+    def replace(self, j, params, both_sides=False):
+        """ (r_p, t_p, r_s, t_s) of the structure with element j replaced by
+            params. The structure itself is unchanged (see update()).
+        """
+        L_p, L_s = self._matrices(params)
+        (P_p, P_s), (S_p, S_s) = self._prefix[j], self._suffix[j]
+        return self._coefficients(S_p @ L_p @ P_p, S_s @ L_s @ P_s, both_sides)
+
+    def update(self, j, params):
+        """ Replaces element j with params, updating the stored products. """
+        self.matrix_params[j] = params
+        self._layers[j] = self._matrices(params)
+        self._products()
+
+    def _coefficients(self, M_p, M_s, both_sides):
+        front = _coefficients_from_matrices(M_p, M_s, self.k0, self.thetas)
+        if not both_sides:
+            return tuple(np.asarray(c) for c in front)
+        back = _coefficients_from_matrices(_swap_diagonal(M_p), _swap_diagonal(M_s), self.k0, self.thetas)
+        return tuple(np.asarray(c) for c in front), tuple(np.asarray(c) for c in back)
+
+def _coefficient_derivatives(M, dM, Y):
+    """ Derivatives (dr, dt) of the coefficients found from characteristic
+        matrix M, given derivatives dM of M (with an extra leading axis), for
+        admittance Y of vacuum.
+    """
+    E = M[..., 0, 0] + M[..., 0, 1]*Y
+    H_divided = (M[..., 1, 0] + M[..., 1, 1]*Y)/Y
+    dE = dM[..., 0, 0] + dM[..., 0, 1]*Y
+    dH_divided = (dM[..., 1, 0] + dM[..., 1, 1]*Y)/Y
+    a_i = (E+H_divided)/2
+    a_r = (E-H_divided)/2
+    da_i = (dE+dH_divided)/2
+    da_r = (dE-dH_divided)/2
+    dr = (da_r*a_i - a_r*da_i)/a_i**2
+    dt = -da_i/a_i**2
+    return dr, dt
+
+def _coefficients_from_matrices(M_p, M_s, k0, thetas):
+    """ Finds (r_p, t_p, r_s, t_s) from the stacked characteristic matrices of
+        the structure, for light incident at thetas in vacuum.
+    """
+    # Field vector (E, H) = M (1, Y), where Y is the admittance of vacuum;
+    # written out element-wise rather than as a matrix product
+    Y_p = 1j*k0/cos(thetas)
+    Y_s = 1j*k0*cos(thetas)
 
     # Note we can use theta here since angle of incidence = angle of outgoing ray
-    E_p = p_field_vector[0, 0]
-    H_p = p_field_vector[1, 0]
-    H_p_divided = H_p/(1j*k0/cos(theta))     # For easier calcs
+    E_p = M_p[..., 0, 0] + M_p[..., 0, 1]*Y_p
+    H_p = M_p[..., 1, 0] + M_p[..., 1, 1]*Y_p
+    H_p_divided = H_p/Y_p     # For easier calcs
 
-    E_s = s_field_vector[0, 0]
-    H_s = s_field_vector[1, 0]
-    H_s_divided = H_s/(1j*k0*cos(theta))     # For easier calcs
+    E_s = M_s[..., 0, 0] + M_s[..., 0, 1]*Y_s
+    H_s = M_s[..., 1, 0] + M_s[..., 1, 1]*Y_s
+    H_s_divided = H_s/Y_s     # For easier calcs
 
 # Calc coefficients for p-polarised light
     a_i_p = (E_p+H_p_divided)/2
@@ -66,3 +350,10 @@ def tmm(matrix_params, wavelength, theta):
     t_s = 1/a_i_s
 
     return (r_p,t_p,r_s,t_s)
+
+def tmm(matrix_params, wavelength, theta):
+    """ Scalar interface for a single (wavelength, theta) pair. Thin wrapper
+        around tmm_batch().
+    """
+    r_p, t_p, r_s, t_s = tmm_batch(matrix_params, wavelength, theta)
+    return (r_p[()], t_p[()], r_s[()], t_s[()])
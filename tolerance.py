@@ -0,0 +1,201 @@
+import numpy as np
+from numpy import pi
+from Starshot.multilayer_sail import _equilibrium_temperature, _W_per_root_density
+from Starshot.motion import fleet_state_vs_t
+
+""" Monte Carlo fabrication-tolerance analysis of a MultilayerSail.
+
+    Layer thicknesses, absorption coefficients and refractive indices of the
+    sail are perturbed at random, and the reflectance, absorptance,
+    equilibrium temperature, W and acceleration distance of every sample are
+    found in batches: each batch of samples is one TMM call for the laser band
+    and one for the thermal emission, with the material data of the sail
+    looked up once. No sail is constructed per sample.
+
+    The laser array (power and diameter) is that of the nominal sail, i.e.
+    the analysis is of sails built to a design and launched by an array built
+    for the design.
+"""
+
+def tolerance_analysis(sail, n_samples=1000, thickness_error=0.02, abs_coeff_error=0.0, n_error=0.0,
+                       seed=None, batch_size=128, t_max=1e4):
+    """Samples fabrication errors of a MultilayerSail and evaluates every sample.
+
+    Parameters
+    ----------
+    MultilayerSail
+        sail
+            - nominal design. Its power (or max power, if power was not
+              given) and laser array diameter are used for every sample.
+    int (optional)
+        n_samples
+            - number of samples
+    float or list of floats (optional)
+        thickness_error
+            - standard deviation of the thickness of each layer, as a
+              fraction of its thickness (normal; thicknesses are kept >= 0).
+              A layer of the unit cell of a periodic sail has the same
+              thickness in every repeat.
+    float or list of floats (optional)
+        abs_coeff_error
+            - standard deviation of the natural log of the absorption
+              coefficient of each layer (log-normal about the nominal value)
+    float or list of floats (optional)
+        n_error
+            - standard deviation of the real refractive index of each layer
+              in the laser band (normal)
+    int (optional)
+        seed
+            - seed of the random number generator
+    int (optional)
+        batch_size
+            - number of samples evaluated in each TMM call
+    float (optional)
+        t_max
+            - end of the time grid of the acceleration [s] (see
+              motion.fleet_state_vs_t)
+
+    Returns
+    -------
+    ToleranceResult
+        Perturbations and results of every sample, and of the nominal sail
+    """
+    rng = np.random.default_rng(seed)
+    materials = sail._material_objects()
+    layers = len(materials)
+    thickness = np.array(sail.thickness, dtype=float)
+    abs_coeff = np.array([material.get_abs_coeff() for material in materials], dtype=float)
+    #Row 0 is the nominal sail; the other rows are the samples
+    shape = (n_samples + 1, layers)
+    thickness_samples = np.tile(thickness, (n_samples + 1, 1))
+    thickness_samples[1:] *= 1 + np.broadcast_to(thickness_error, (layers,))*rng.standard_normal((n_samples, layers))
+    thickness_samples = np.maximum(thickness_samples, 0)
+    abs_coeff_samples = np.tile(abs_coeff, (n_samples + 1, 1))
+    abs_coeff_samples[1:] *= np.exp(np.broadcast_to(abs_coeff_error, (layers,))*rng.standard_normal((n_samples, layers)))
+    n_shift = np.zeros(shape)
+    n_shift[1:] = np.broadcast_to(n_error, (layers,))*rng.standard_normal((n_samples, layers))
+
+    #Emitted power is integrated with the quadrature the sail's own integration
+    #uses at its temperature reached and max temperature, so the nominal
+    #temperature matches sail.temp_reached
+    max_temp = sail._find_max_temp()
+    quadrature = sail._emission_quadrature([sail.temp_reached, max_temp])
+    optics = sail._find_batch_optics(thickness_samples, abs_coeff_samples, n_shift, batch_size, quadrature)
+    reflectance, transmittance = optics['reflectance'], optics['transmittance']
+    density = np.array([material.get_density() for material in materials])*sail._layer_copies()
+
+    #Mass and area: whichever the sail was given is fixed
+    s_density = thickness_samples @ density
+    if sail._mass is None:
+        area = np.full(n_samples + 1, float(sail.area))
+        mass = area*s_density
+    else:
+        mass = np.full(n_samples + 1, float(sail.mass))
+        area = mass/s_density
+    power = sail.power
+    wavelength, target = sail.wavelength, sail.target
+
+    #Equilibrium temperature, as MultilayerSail._find_eq_temps_given_abs_coeff
+    betas = optics['betas']
+    doppler = (1-betas)/(1+betas)
+    power_absorbed = power*np.maximum(np.max(optics['beta_absorptance']*doppler, axis=-1)*s_density/mass, 0)
+    temp_reached = _equilibrium_temperature(power_absorbed, optics['emission_wavelengths'], optics['emission_weights'],
+                                            optics['emissivity'])
+
+    #W (see Sail._find_W) and acceleration to target with the nominal laser array
+    W = _W_per_root_density(target)*np.sqrt(s_density*1000)/reflectance
+    _, _, t_stop, x_stop = fleet_state_vs_t(mass, power, np.sqrt(area/pi), sail.diameter, wavelength,
+                                            reflectance, target=target, t_max=t_max)
+    distance = np.where(np.isnan(t_stop), np.nan, x_stop[1])
+
+    return ToleranceResult(thickness_samples, abs_coeff_samples, n_shift, reflectance, transmittance,
+                           optics['absorptance'][:, 0], s_density, mass, temp_reached, max_temp, W, distance, t_stop)
+
+class ToleranceResult:
+    """
+    Samples of a tolerance analysis (see tolerance_analysis). Arrays have one
+    entry (or row) per sample.
+
+    ...
+
+    Attributes
+    ----------
+    thickness : array of floats
+        Thickness of each layer [m], shape (samples, layers)
+    abs_coeff : array of floats
+        Absorption coefficient of each layer [cm^-1], shape (samples, layers)
+    n_shift : array of floats
+        Change in the real refractive index of each layer in the laser band,
+        shape (samples, layers)
+    reflectance : array of floats
+        Reflectance averaged over the Doppler-shifted band
+    transmittance : array of floats
+        Transmittance averaged over the Doppler-shifted band
+    absorptance : array of floats
+        Absorptance at the laser wavelength
+    s_density : array of floats
+        Surface density [kg/m^2]
+    mass : array of floats
+        Mass of lightsail [kg]
+    temp_reached : array of floats
+        Maximum equilibrium temperature on the journey [K]
+    max_temp : float
+        Maximum temperature of the materials and Starchip [K]
+    W : array of floats
+        Square root of RAAD [sqrt(g)/m]
+    distance : array of floats
+        Acceleration distance to the target speed [m]. NaN if the target
+        speed is not reached within the time grid.
+    time : array of floats
+        Acceleration time to the target speed [s]. NaN if not reached.
+    passed : array of bools
+        Whether the temperature reached is within max_temp
+    nominal : dict
+        Results of the nominal sail, evaluated the same way
+
+    Methods
+    -------
+    yield_fraction()
+        Fraction of samples within the temperature limits
+    percentiles(variable, q=(5, 50, 95))
+        Percentiles of a result over the samples
+    summary()
+        Prints the yield and the distribution of each result
+    """
+    _RESULTS = ['reflectance', 'transmittance', 'absorptance', 's_density', 'mass', 'temp_reached', 'W',
+                'distance', 'time']
+
+    def __init__(self, thickness, abs_coeff, n_shift, reflectance, transmittance, absorptance, s_density,
+                 mass, temp_reached, max_temp, W, distance, time):
+        """The constructor for ToleranceResult class. Row 0 of each array is
+        the nominal sail; the other rows are the samples."""
+        values = dict(thickness=thickness, abs_coeff=abs_coeff, n_shift=n_shift, reflectance=reflectance,
+                      transmittance=transmittance, absorptance=absorptance, s_density=s_density, mass=mass,
+                      temp_reached=temp_reached, W=W, distance=distance, time=time)
+        self.nominal = {variable: value[0] for variable, value in values.items()}
+        for variable, value in values.items():
+            setattr(self, variable, value[1:])
+        self.max_temp = max_temp
+        self.passed = self.temp_reached <= max_temp
+
+    def yield_fraction(self):
+        """Returns the fraction of samples whose temperature reached is within
+        the max temperature of the materials and Starchip."""
+        return np.mean(self.passed)
+
+    def percentiles(self, variable, q=(5, 50, 95)):
+        """Returns percentiles q of variable (e.g. 'distance') over the
+        samples, ignoring NaN."""
+        return np.nanpercentile(getattr(self, variable), q)
+
+    def summary(self):
+        """Prints the yield and the 5th, 50th and 95th percentiles of each
+        result, with the nominal value."""
+        print(f'Yield = {self.yield_fraction():.3f} ({np.sum(self.passed)}/{self.passed.size} samples '
+              f'within {self.max_temp:.4g} K)')
+        for variable in self._RESULTS:
+            low, median, high = self.percentiles(variable)
+            print(f'{variable}: nominal = {self.nominal[variable]:.6g}, 5% = {low:.6g}, '
+                  f'50% = {median:.6g}, 95% = {high:.6g}')
+        reached = np.mean(~np.isnan(self.distance))
+        print(f'Fraction reaching target speed = {reached:.3f}')